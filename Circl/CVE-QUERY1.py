@@ -1,10 +1,18 @@
-import requests
 import json
+import os
+import sys
+
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
 
 CVE_URL = "https://cve.circl.lu/api/last/100"
 
+# The "last 100" feed moves quickly, so only reuse it for an hour
+session = CachedSession("circl", ttl=3600)
+
 def fetch_cve_data():
-    response = requests.get(CVE_URL)
+    response = session.get(CVE_URL)
     if response.status_code != 200:
         print("Failed to fetch CVE data")
         return []
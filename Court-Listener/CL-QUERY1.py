@@ -1,13 +1,20 @@
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 import json
 
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
+
 LEGAL_URL = "https://www.courtlistener.com/opinion/"
 
+session = CachedSession("courtlistener", ttl=86400)
+
 def scrape_legal_cases():
     case_data = []
     for i in range(1, 5):  # Scraping first 5 pages
-        response = requests.get(f"{LEGAL_URL}?page={i}")
+        response = session.get(LEGAL_URL, params={"page": i})
         if response.status_code != 200:
             print("Failed to fetch legal cases")
             return []
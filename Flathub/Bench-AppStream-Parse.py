@@ -0,0 +1,109 @@
+"""
+Compare peak RSS and wall time of the AppStream parse paths in Query-Flathub.py.
+
+  legacy     read the whole .xml.gz, gzip.decompress() it, then iterparse the bytes
+  streaming  open_appstream()-style incremental gunzip fed straight into iter_components()
+
+Each path runs in a fresh subprocess so ru_maxrss reflects that path alone.
+
+Examples:
+  # Benchmark the cached x86_64 feed written by Query-Flathub.py
+  python Bench-AppStream-Parse.py --feed ~/.cache/flathub-appstream/appstream-x86_64.xml.gz
+
+  # No feed at hand: synthesize one with 200k components
+  python Bench-AppStream-Parse.py --components 200000
+"""
+
+import argparse
+import gzip
+import importlib.util
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_query_flathub():
+    spec = importlib.util.spec_from_file_location("query_flathub", os.path.join(HERE, "Query-Flathub.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def write_synthetic_feed(path: str, n: int) -> None:
+    with gzip.open(path, "wb") as f:
+        f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<components version="0.8" origin="flathub">\n')
+        for i in range(n):
+            f.write(
+                f'<component type="desktop-application"><id>org.example.App{i}</id>'
+                f'<name>App {i}</name><summary>Synthetic component number {i}</summary>'
+                f'<description><p>{"Lorem ipsum dolor sit amet. " * 20}</p></description>'
+                f'<categories><category>Development</category><category>Utility</category></categories>'
+                f'<releases><release version="1.{i}" timestamp="{1600000000 + i}"/></releases>'
+                f'</component>\n'.encode("utf-8")
+            )
+        f.write(b"</components>\n")
+
+
+def run_one(mode: str, feed: str) -> None:
+    qf = load_query_flathub()
+    start = time.perf_counter()
+    if mode == "legacy":
+        with open(feed, "rb") as f:
+            xml_bytes = gzip.decompress(f.read())
+        count = sum(1 for _ in qf.iter_components(xml_bytes))
+    else:
+        with gzip.open(feed, "rb") as stream:
+            count = sum(1 for _ in qf.iter_components(stream))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    print(f"{mode} {count} {elapsed:.3f} {peak}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark legacy vs streaming AppStream parsing.")
+    p.add_argument("--feed", help="Path to an appstream.xml.gz (default: synthesize one)")
+    p.add_argument("--components", type=int, default=100000, help="Components in the synthetic feed (default: 100000)")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per path; best time and peak RSS are reported (default: 3)")
+    p.add_argument("--_run", nargs=2, metavar=("MODE", "FEED"), help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args._run:
+        run_one(*args._run)
+        return
+
+    tmp = None
+    feed = args.feed
+    if not feed:
+        tmp = tempfile.NamedTemporaryFile(suffix=".xml.gz", delete=False)
+        tmp.close()
+        feed = tmp.name
+        print(f"Synthesizing feed with {args.components} components -> {feed}")
+        write_synthetic_feed(feed, args.components)
+
+    try:
+        print(f"Feed: {feed} ({os.path.getsize(feed) / 1e6:.1f} MB compressed)")
+        print(f"{'path':10} {'components':>10} {'best s':>8} {'peak RSS MiB':>13}")
+        for mode in ("legacy", "streaming"):
+            times, peaks, count = [], [], 0
+            for _ in range(max(1, args.repeat)):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--_run", mode, feed],
+                    check=True, capture_output=True, text=True,
+                ).stdout.split()
+                count, times, peaks = int(out[1]), times + [float(out[2])], peaks + [int(out[3])]
+            print(f"{mode:10} {count:>10} {min(times):>8.3f} {min(peaks) / 1024:>13.1f}")
+    finally:
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,19 +16,39 @@ Examples:
   # Combine multiple refs files
   python Download-Flathub-Refs.py -f refs/WebBrowser.refs -f refs/Development.refs
 
+  # Sync every category with 8 workers sharing a pool of keep-alive connections
+  python Download-Flathub-Refs.py --refs-dir refs --jobs 8
+
+  # Nightly incremental sync: fetch only added/changed apps, prune removed ones
+  python Download-Flathub-Refs.py --refs-dir refs --sync --jobs 8
+
 Notes:
 - Primary URL used: https://dl.flathub.org/repo/appstream/<app_id>.flatpakref
 - Fallback URL:      https://flathub.org/repo/appstream/<app_id>.flatpakref
 - This script downloads only the tiny .flatpakref descriptor files, not the app bundles themselves.
+- With --jobs N, N workers share a bounded pool of keep-alive HTTPS connections, so thousands of
+  refs cost a handful of TLS handshakes instead of one per file. --throttle and --limit are global.
+- With --sync, a manifest in the output dir records each app's newest AppStream release (read from
+  the index.sqlite that Query-Flathub.py maintains) and the sha256 of its .flatpakref. Only apps
+  that were added, whose release changed, or whose local file no longer matches are downloaded,
+  and apps no longer listed in the refs are pruned.
 """
 
 import argparse
+import hashlib
+import http.client
+import json
 import os
+import queue
 import re
+import sqlite3
 import sys
+import threading
 import time
-from typing import Iterable, Set, List
+from contextlib import closing
+from typing import Callable, Dict, Iterable, Iterator, Set, List, Optional, Tuple
 import urllib.error
+import urllib.parse
 import urllib.request
 
 PRIMARY_TMPL = "https://dl.flathub.org/repo/appstream/{app_id}.flatpakref"
@@ -36,9 +56,14 @@ FALLBACK_TMPL = "https://flathub.org/repo/appstream/{app_id}.flatpakref"
 
 REF_LINE_RE = re.compile(r"^\s*app/([^/]+)/([^/]+)/([^/]+)\s*$")
 
+DEFAULT_INDEX = os.path.join(os.path.expanduser("~"), ".cache", "flathub-appstream", "index.sqlite")
+SYNC_MANIFEST = ".flathub-sync.json"
+# Layout of the index that load_releases() reads; must match INDEX_SCHEMA_VERSION in Query-Flathub.py
+INDEX_SCHEMA_VERSION = 2
 
-def parse_refs_file(path: str) -> Set[str]:
-    app_ids: Set[str] = set()
+
+def iter_refs(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (app_id, arch) for each well-formed app ref in a .refs file."""
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -52,8 +77,11 @@ def parse_refs_file(path: str) -> Set[str]:
             # Basic sanity: App IDs usually contain at least one dot
             if "." not in app_id:
                 continue
-            app_ids.add(app_id)
-    return app_ids
+            yield app_id, m.group(2)
+
+
+def parse_refs_file(path: str) -> Set[str]:
+    return {app_id for app_id, _ in iter_refs(path)}
 
 
 essential_headers = {
@@ -69,8 +97,116 @@ def urlretrieve(url: str, dest: str, timeout: int = 30) -> None:
         f.write(data)
 
 
-def download_flatpakref(app_id: str, out_dir: str, skip_existing: bool = True, timeout: int = 30) -> str:
-    """Download .flatpakref for given app_id. Returns the output path or raises on failure."""
+class ConnectionPool:
+    """Bounded pool of keep-alive HTTPS connections, kept idle per host between requests."""
+
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+    def __init__(self, size: int, timeout: int = 30):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: Dict[str, "queue.LifoQueue[http.client.HTTPSConnection]"] = {}
+        self._lock = threading.Lock()
+
+    def _idle_for(self, host: str) -> "queue.LifoQueue[http.client.HTTPSConnection]":
+        with self._lock:
+            q = self._idle.get(host)
+            if q is None:
+                q = queue.LifoQueue(maxsize=self.size)
+                self._idle[host] = q
+            return q
+
+    def _checkout(self, host: str) -> http.client.HTTPSConnection:
+        try:
+            return self._idle_for(host).get_nowait()
+        except queue.Empty:
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+
+    def _checkin(self, host: str, conn: http.client.HTTPSConnection) -> None:
+        try:
+            self._idle_for(host).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, host: str, path: str) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        with self._slots:
+            conn = self._checkout(host)
+            try:
+                conn.request("GET", path, headers=essential_headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                # An idle keep-alive connection may have been closed by the server: retry once fresh
+                conn.close()
+                conn = http.client.HTTPSConnection(host, timeout=self.timeout)
+                try:
+                    conn.request("GET", path, headers=essential_headers)
+                    resp = conn.getresponse()
+                    body = resp.read()
+                except Exception:
+                    conn.close()
+                    raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(host, conn)
+            return resp.status, resp.reason, resp.headers, body
+
+    def get(self, url: str, max_redirects: int = 3) -> bytes:
+        """GET url over a pooled connection, following redirects. Raises HTTPError on non-200."""
+        for _ in range(max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            status, reason, headers, body = self._request(parts.netloc, path)
+            location = headers.get("Location")
+            if status in self.REDIRECT_CODES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if status != 200:
+                raise urllib.error.HTTPError(url, status, reason, headers, None)
+            return body
+        raise RuntimeError(f"Too many redirects for {url}")
+
+    def close(self) -> None:
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle = {}
+        for q in idle:
+            while True:
+                try:
+                    q.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class Throttle:
+    """Spaces download starts at least `interval` seconds apart across all workers."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def download_flatpakref(app_id: str, out_dir: str, skip_existing: bool = True, timeout: int = 30,
+                        pool: Optional[ConnectionPool] = None) -> str:
+    """Download .flatpakref for given app_id. Returns the output path or raises on failure.
+
+    When a ConnectionPool is given, the request reuses one of its keep-alive connections.
+    """
     os.makedirs(out_dir, exist_ok=True)
     out_path = os.path.join(out_dir, f"{app_id}.flatpakref")
 
@@ -82,7 +218,12 @@ def download_flatpakref(app_id: str, out_dir: str, skip_existing: bool = True, t
     last_err: Exception | None = None
     for url in urls:
         try:
-            urlretrieve(url, out_path, timeout=timeout)
+            if pool is not None:
+                data = pool.get(url)
+                with open(out_path, "wb") as f:
+                    f.write(data)
+            else:
+                urlretrieve(url, out_path, timeout=timeout)
             return out_path
         except urllib.error.HTTPError as e:
             # 404 or other HTTP error: try next
@@ -94,17 +235,177 @@ def download_flatpakref(app_id: str, out_dir: str, skip_existing: bool = True, t
     raise RuntimeError("Unknown download failure")
 
 
+def download_serial(app_ids: List[str], out_dir: str, skip_existing: bool = True, throttle: float = 0.0,
+                    limit: int = 0, on_done: Optional[Callable[[str, str], None]] = None) -> Tuple[int, int]:
+    """Download app_ids one at a time. Returns (ok, fail)."""
+    ok = 0
+    fail = 0
+    for app_id in app_ids:
+        if limit and ok >= limit:
+            break
+        try:
+            out_path = download_flatpakref(app_id, out_dir, skip_existing=skip_existing)
+            ok += 1
+            print(f"[{ok}] Saved {out_path}")
+            if on_done:
+                on_done(app_id, out_path)
+        except Exception as e:
+            fail += 1
+            print(f"Error downloading {app_id}: {e}", file=sys.stderr)
+        if throttle > 0:
+            time.sleep(throttle)
+    return ok, fail
+
+
+def download_concurrent(app_ids: List[str], out_dir: str, jobs: int, skip_existing: bool = True,
+                        throttle: float = 0.0, limit: int = 0,
+                        on_done: Optional[Callable[[str, str], None]] = None) -> Tuple[int, int]:
+    """Download app_ids with `jobs` workers over a shared ConnectionPool. Returns (ok, fail).
+
+    The throttle spaces requests globally, and the limit counts successes across all workers.
+    on_done(app_id, out_path) is called for each success, serialized across workers.
+    """
+    pool = ConnectionPool(jobs)
+    pacer = Throttle(throttle)
+    lock = threading.Lock()
+    pending = iter(app_ids)
+    state = {"ok": 0, "fail": 0, "inflight": 0}
+
+    def claim() -> Optional[str]:
+        with lock:
+            # Reserve a slot for in-flight downloads so --limit is never overshot
+            if limit and state["ok"] + state["inflight"] >= limit:
+                return None
+            app_id = next(pending, None)
+            if app_id is not None:
+                state["inflight"] += 1
+            return app_id
+
+    def worker() -> None:
+        while True:
+            app_id = claim()
+            if app_id is None:
+                return
+            pacer.wait()
+            try:
+                out_path = download_flatpakref(app_id, out_dir, skip_existing=skip_existing, pool=pool)
+            except Exception as e:
+                with lock:
+                    state["inflight"] -= 1
+                    state["fail"] += 1
+                    print(f"Error downloading {app_id}: {e}", file=sys.stderr)
+            else:
+                with lock:
+                    state["inflight"] -= 1
+                    state["ok"] += 1
+                    print(f"[{state['ok']}] Saved {out_path}")
+                    if on_done:
+                        on_done(app_id, out_path)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, jobs))]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        pool.close()
+    return state["ok"], state["fail"]
+
+
 def collect_app_ids(refs_files: Iterable[str]) -> List[str]:
     all_ids: Set[str] = set()
     for rf in refs_files:
         try:
             ids = parse_refs_file(rf)
             all_ids.update(ids)
-        except FileNotFoundError:
-            print(f"Warning: refs file not found: {rf}", file=sys.stderr)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Warning: cannot read refs file {rf}: {e}", file=sys.stderr)
     return sorted(all_ids)
 
 
+def collect_app_arches(refs_files: Iterable[str]) -> Tuple[Dict[str, Set[str]], List[str]]:
+    """Map each app to its arches; also returns the refs files that could not be read."""
+    out: Dict[str, Set[str]] = {}
+    unreadable: List[str] = []
+    for rf in refs_files:
+        try:
+            for app_id, arch in iter_refs(rf):
+                out.setdefault(app_id, set()).add(arch)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Warning: cannot read refs file {rf}: {e}", file=sys.stderr)
+            unreadable.append(rf)
+    return out, unreadable
+
+
+def load_releases(index_path: str, app_arches: Dict[str, Set[str]]) -> Dict[str, str]:
+    """Map each app to its newest release on the arches it is listed for ("" if unknown).
+
+    Release data comes from the component index that Query-Flathub.py builds.
+    """
+    def no_releases(problem: str) -> Dict[str, str]:
+        print(f"Warning: {problem}; only added/removed apps are detected. "
+              "Run Query-Flathub.py to build or upgrade it.", file=sys.stderr)
+        return {app_id: "" for app_id in app_arches}
+
+    if not os.path.exists(index_path):
+        return no_releases(f"AppStream index not found: {index_path}")
+    with closing(sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)) as db:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_SCHEMA_VERSION:
+            # Indexes before v2 have no release column
+            return no_releases(f"AppStream index {index_path} has schema v{version}, expected v{INDEX_SCHEMA_VERSION}")
+        known = {(arch, app_id): release for arch, app_id, release in db.execute("SELECT arch, id, release FROM components")}
+    return {app_id: "|".join(sorted({known.get((arch, app_id), "") for arch in arches}))
+            for app_id, arches in app_arches.items()}
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(out_dir: str) -> Dict[str, Dict[str, str]]:
+    path = os.path.join(out_dir, SYNC_MANIFEST)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("apps", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable sync manifest {path}: {e}", file=sys.stderr)
+        return {}
+
+
+def save_manifest(out_dir: str, apps: Dict[str, Dict[str, str]]) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, SYNC_MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"updated_at": int(time.time()), "apps": apps}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def plan_sync(manifest: Dict[str, Dict[str, str]], releases: Dict[str, str],
+              out_dir: str) -> Tuple[List[str], List[str], List[str]]:
+    """Diff the wanted apps against the manifest. Returns (added, changed, removed)."""
+    added = sorted(set(releases) - set(manifest))
+    removed = sorted(set(manifest) - set(releases))
+    changed = []
+    for app_id in sorted(set(releases) & set(manifest)):
+        entry = manifest[app_id]
+        path = os.path.join(out_dir, f"{app_id}.flatpakref")
+        if entry.get("release") != releases[app_id]:
+            changed.append(app_id)
+        elif not os.path.exists(path) or sha256_file(path) != entry.get("sha256"):
+            # Deleted or edited locally: restore it
+            changed.append(app_id)
+    return added, changed, removed
+
+
 def find_refs_in_dir(refs_dir: str) -> List[str]:
     out: List[str] = []
     for name in os.listdir(refs_dir):
@@ -113,6 +414,53 @@ def find_refs_in_dir(refs_dir: str) -> List[str]:
     return sorted(out)
 
 
+def sync(args, refs_files: List[str]) -> None:
+    app_arches, unreadable = collect_app_arches(refs_files)
+    releases = load_releases(args.index, app_arches)
+    manifest = load_manifest(args.out)
+    added, changed, removed = plan_sync(manifest, releases, args.out)
+    print(f"Sync plan: {len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+          f"{len(releases) - len(added) - len(changed)} unchanged.")
+
+    pruned = 0
+    if args.prune and unreadable:
+        # Apps from a missing refs file would all look removed; never prune on a partial listing
+        print(f"Not pruning: {len(unreadable)} refs file(s) could not be read, so the removed list is unreliable.",
+              file=sys.stderr)
+    elif args.prune:
+        for app_id in removed:
+            path = os.path.join(args.out, f"{app_id}.flatpakref")
+            try:
+                os.remove(path)
+                print(f"Pruned {path}")
+            except FileNotFoundError:
+                pass
+            manifest.pop(app_id, None)
+            pruned += 1
+
+    def record(app_id: str, out_path: str) -> None:
+        manifest[app_id] = {"release": releases[app_id], "sha256": sha256_file(out_path)}
+
+    todo = added + changed
+    try:
+        if args.jobs > 1:
+            ok, fail = download_concurrent(todo, args.out, args.jobs, skip_existing=False,
+                                           throttle=args.throttle, limit=args.limit, on_done=record)
+        else:
+            ok, fail = download_serial(todo, args.out, skip_existing=False,
+                                       throttle=args.throttle, limit=args.limit, on_done=record)
+    finally:
+        # Persist whatever completed so an interrupted sync resumes where it stopped
+        save_manifest(args.out, manifest)
+
+    print("\n== Summary ==")
+    print(f"Successful: {ok}")
+    print(f"Failed:     {fail}")
+    print(f"Pruned:     {pruned}")
+    if fail and ok == 0:
+        sys.exit(1)
+
+
 def main():
     p = argparse.ArgumentParser(description="Download .flatpakref files for apps listed in .refs files.")
     p.add_argument("--refs-file", "-f", action="append", dest="refs_files", help="Path to a .refs file (repeatable)")
@@ -122,6 +470,10 @@ def main():
     p.add_argument("--no-skip-existing", dest="skip_existing", action="store_false", help="Do not skip existing files; overwrite")
     p.add_argument("--throttle", type=float, default=0.0, help="Seconds to sleep between downloads to be gentle on server")
     p.add_argument("--limit", type=int, default=0, help="Stop after downloading this many .flatpakref files (0 = no limit)")
+    p.add_argument("--jobs", "-j", type=int, default=1, help="Concurrent downloads over pooled keep-alive connections (default: 1)")
+    p.add_argument("--sync", action="store_true", help="Incremental sync: download only added/changed apps and prune removed ones")
+    p.add_argument("--index", default=DEFAULT_INDEX, help=f"Query-Flathub.py component index used by --sync (default: {DEFAULT_INDEX})")
+    p.add_argument("--no-prune", dest="prune", action="store_false", help="With --sync, keep files of apps no longer listed")
     args = p.parse_args()
 
     refs_files: List[str] = []
@@ -144,20 +496,16 @@ def main():
 
     print(f"Found {len(app_ids)} unique app IDs across {len(refs_files)} refs file(s).")
 
-    ok = 0
-    fail = 0
-    for i, app_id in enumerate(app_ids, start=1):
-        if args.limit and ok >= args.limit:
-            break
-        try:
-            out_path = download_flatpakref(app_id, args.out, skip_existing=args.skip_existing)
-            ok += 1
-            print(f"[{ok}] Saved {out_path}")
-        except Exception as e:
-            fail += 1
-            print(f"Error downloading {app_id}: {e}", file=sys.stderr)
-        if args.throttle > 0:
-            time.sleep(args.throttle)
+    if args.sync:
+        sync(args, refs_files)
+        return
+
+    if args.jobs > 1:
+        ok, fail = download_concurrent(app_ids, args.out, args.jobs, skip_existing=args.skip_existing,
+                                       throttle=args.throttle, limit=args.limit)
+    else:
+        ok, fail = download_serial(app_ids, args.out, skip_existing=args.skip_existing,
+                                   throttle=args.throttle, limit=args.limit)
 
     print("\n== Summary ==")
     print(f"Successful: {ok}")
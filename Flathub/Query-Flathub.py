@@ -16,28 +16,129 @@ Examples:
 
   # Different arch/branch and an output dir
   ./flathub_select_refs.py -c Development --arch aarch64 --branch stable --out refs-aarch64
+
+  # Reuse the cached feed without even revalidating if it is less than an hour old
+  ./flathub_select_refs.py --dump-categories --max-age 3600
+
+  # Development apps available on both x86_64 and aarch64
+  ./flathub_select_refs.py -c Development --arch x86_64 --arch aarch64 --require-all-arches
+
+The AppStream feed is cached per arch in --cache-dir and revalidated with
+If-None-Match/If-Modified-Since, so an unchanged feed is never downloaded twice.
+Each feed version is parsed once into a SQLite index (index.sqlite in the cache
+dir); arches are fetched and indexed concurrently and every query is a lookup.
 """
 
 import argparse
 import gzip
 import io
+import json
 import os
+import shutil
+import sqlite3
 import sys
+import time
+import urllib.error
 import urllib.request
 import xml.etree.ElementTree as ET
-from collections import defaultdict, Counter
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Optional
 
 APPSTREAM_URL_TMPL = "https://dl.flathub.org/repo/appstream/{arch}/appstream.xml.gz"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "flathub-appstream")
+# Bump when the index tables or what goes into them change, to force a rebuild
+INDEX_SCHEMA_VERSION = 2
+
+def cached_appstream(arch: str, cache_dir: str, max_age: float = 0.0) -> str:
+    """Return the path of an up-to-date appstream.xml.gz for arch in cache_dir.
+
+    A cached copy younger than max_age seconds is used as-is. Otherwise it is
+    revalidated with a conditional GET and only re-downloaded when it changed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    gz_path = os.path.join(cache_dir, f"appstream-{arch}.xml.gz")
+    meta_path = os.path.join(cache_dir, f"appstream-{arch}.json")
+
+    meta = {}
+    if os.path.exists(gz_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+    if meta and max_age > 0 and time.time() - meta.get("checked_at", 0) < max_age:
+        return gz_path
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    req = urllib.request.Request(APPSTREAM_URL_TMPL.format(arch=arch), headers=headers)
+
+    try:
+        with urllib.request.urlopen(req) as r:
+            tmp_path = gz_path + ".part"
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(r, f, 1024 * 1024)
+            os.replace(tmp_path, gz_path)
+            meta = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or not meta:
+            raise
+    except urllib.error.URLError as e:
+        if not meta:
+            raise
+        print(f"Warning: could not revalidate {arch} feed ({e.reason}); using cached copy.", file=sys.stderr)
+        return gz_path
 
-def fetch_appstream(arch: str) -> bytes:
-    url = APPSTREAM_URL_TMPL.format(arch=arch)
-    with urllib.request.urlopen(url) as r:
-        gz = r.read()
-    return gzip.decompress(gz)
+    meta["checked_at"] = time.time()
+    tmp_meta = meta_path + ".part"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+    return gz_path
 
-def iter_components(xml_bytes: bytes):
-    # Stream parse to keep memory low
-    ctx = ET.iterparse(io.BytesIO(xml_bytes), events=("start", "end"))
+def fetch_appstream(arch: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, max_age: float = 0.0) -> bytes:
+    """Return the whole decompressed feed. Prefer open_appstream(), which streams it."""
+    with open_appstream(arch, cache_dir=cache_dir, max_age=max_age) as stream:
+        return stream.read()
+
+def open_appstream(arch: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, max_age: float = 0.0) -> gzip.GzipFile:
+    """Open the feed for arch as an incrementally decompressed binary stream.
+
+    Reads from the cache file when caching is enabled, otherwise straight from
+    the HTTP response; the compressed feed is never held in memory as a whole.
+    """
+    if cache_dir:
+        return gzip.open(cached_appstream(arch, cache_dir, max_age), "rb")
+    resp = urllib.request.urlopen(APPSTREAM_URL_TMPL.format(arch=arch))
+    stream = gzip.GzipFile(fileobj=resp, mode="rb")
+    # GzipFile does not close a fileobj it was handed, so close the response with it
+    close = stream.close
+    def close_both():
+        close()
+        resp.close()
+    stream.close = close_both
+    return stream
+
+def iter_components(source):
+    """Yield {"type", "id", "categories", "release"} per <component> from a binary stream (or bytes).
+
+    "release" is "<version>@<timestamp or date>" of the first (newest) <release>, if any.
+
+    Each finished <component> subtree is dropped before the next one is read,
+    so memory stays bounded by the largest single component.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    ctx = ET.iterparse(source, events=("start", "end"))
     _, root = next(ctx)  # get root element
     in_component = False
     comp = {}
@@ -51,6 +152,11 @@ def iter_components(xml_bytes: bytes):
             comp = {"type": elem.attrib.get("type", "")}
             cats = []
 
+        elif event == "start" and tag == "release":
+            if in_component and "release" not in comp:
+                stamp = elem.attrib.get("timestamp") or elem.attrib.get("date", "")
+                comp["release"] = f"{elem.attrib.get('version', '')}@{stamp}"
+
         elif event == "end":
             if in_component:
                 if tag == "id":
@@ -68,6 +174,7 @@ def iter_components(xml_bytes: bytes):
                     comp = {}
                     cats = []
                     in_component = False
+                    elem.clear()
                     root.clear()
 
 def normalize_category(cat: str) -> str:
@@ -78,6 +185,109 @@ def normalize_category(cat: str) -> str:
 def make_ref(app_id: str, arch: str, branch: str) -> str:
     return f"app/{app_id}/{arch}/{branch}"
 
+def open_index(cache_dir: Optional[str]) -> sqlite3.Connection:
+    """Open (creating if needed) the component index; in-memory when caching is off."""
+    path = ":memory:"
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, "index.sqlite")
+    db = sqlite3.connect(path)
+    if db.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+        db.executescript("""
+            DROP TABLE IF EXISTS feeds;
+            DROP TABLE IF EXISTS components;
+            DROP TABLE IF EXISTS categories;
+        """)
+        db.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS feeds (arch TEXT PRIMARY KEY, version TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS components (
+            arch TEXT NOT NULL, id TEXT NOT NULL, type TEXT NOT NULL, release TEXT NOT NULL,
+            PRIMARY KEY (arch, id));
+        CREATE TABLE IF NOT EXISTS categories (
+            category TEXT NOT NULL, arch TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (category, arch, id));
+    """)
+    return db
+
+def read_feed_components(arch: str, cache_dir: Optional[str], max_age: float, known_version: Optional[str]):
+    """Fetch arch's feed and parse it into [(id, type, [category, ...], release)].
+
+    Returns (version, components); components is None when the cached feed still
+    matches known_version and the index for this arch is already current.
+    """
+    if cache_dir:
+        gz_path = cached_appstream(arch, cache_dir, max_age)
+        st = os.stat(gz_path)
+        version = f"{INDEX_SCHEMA_VERSION}:{st.st_size}:{st.st_mtime_ns}"
+        if version == known_version:
+            return version, None
+        stream = gzip.open(gz_path, "rb")
+    else:
+        version = ""
+        stream = open_appstream(arch, cache_dir=None)
+
+    components = []
+    with stream:
+        for comp in iter_components(stream):
+            app_id = comp.get("id", "")
+            if not app_id or "." not in app_id:
+                continue  # skip garbage IDs
+            # Not filtering by type; flathub contains mixed types, so keep it for queries instead
+            cats = [normalize_category(c) for c in comp.get("categories", []) or []]
+            components.append((app_id, comp.get("type", ""), cats, comp.get("release", "")))
+    return version, components
+
+def update_index(db: sqlite3.Connection, arches, cache_dir: Optional[str], max_age: float = 0.0,
+                 reindex: bool = False) -> None:
+    """Bring the index up to date for arches, fetching and parsing them concurrently."""
+    known = {} if reindex else dict(db.execute("SELECT arch, version FROM feeds"))
+
+    def load(arch):
+        return arch, *read_feed_components(arch, cache_dir, max_age, known.get(arch))
+
+    with ThreadPoolExecutor(max_workers=len(arches)) as ex:
+        for arch, version, components in ex.map(load, arches):
+            if components is None:
+                continue
+            with db:
+                db.execute("DELETE FROM components WHERE arch = ?", (arch,))
+                db.execute("DELETE FROM categories WHERE arch = ?", (arch,))
+                db.executemany("INSERT OR IGNORE INTO components VALUES (?, ?, ?, ?)",
+                               ((arch, app_id, ctype, release) for app_id, ctype, _, release in components))
+                db.executemany("INSERT OR IGNORE INTO categories VALUES (?, ?, ?)",
+                               ((c, arch, app_id) for app_id, _, cats, _ in components for c in cats))
+                db.execute("INSERT OR REPLACE INTO feeds VALUES (?, ?)", (arch, version))
+            print(f"Indexed {len(components)} components for {arch}")
+
+def indexed_categories(db: sqlite3.Connection, arches) -> list:
+    marks = ",".join("?" * len(arches))
+    sql = f"SELECT DISTINCT category FROM categories WHERE arch IN ({marks}) ORDER BY category"
+    return [row[0] for row in db.execute(sql, list(arches))]
+
+def category_counts(db: sqlite3.Connection, arches) -> list:
+    """Return [(category, [count per arch])], most populated categories first."""
+    marks = ",".join("?" * len(arches))
+    pos = {arch: i for i, arch in enumerate(arches)}
+    counts = defaultdict(lambda: [0] * len(arches))
+    sql = f"SELECT category, arch, COUNT(*) FROM categories WHERE arch IN ({marks}) GROUP BY category, arch"
+    for cat, arch, cnt in db.execute(sql, list(arches)):
+        counts[cat][pos[arch]] = cnt
+    return sorted(counts.items(), key=lambda kv: (-sum(kv[1]), kv[0]))
+
+def category_refs(db: sqlite3.Connection, category: str, arches, branch: str, require_all: bool = False) -> list:
+    """Refs for every app in category on each of arches.
+
+    With require_all, only apps available on all of the given arches are kept.
+    """
+    marks = ",".join("?" * len(arches))
+    if require_all:
+        sql = (f"SELECT id FROM categories WHERE category = ? AND arch IN ({marks}) "
+               "GROUP BY id HAVING COUNT(DISTINCT arch) = ?")
+        ids = [row[0] for row in db.execute(sql, [category, *arches, len(arches)])]
+        return [make_ref(i, arch, branch) for arch in arches for i in ids]
+    sql = f"SELECT id, arch FROM categories WHERE category = ? AND arch IN ({marks})"
+    return [make_ref(i, arch, branch) for i, arch in db.execute(sql, [category, *arches])]
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("-c", "--category", dest="categories", action="append",
@@ -86,49 +296,40 @@ def main():
                    help="Generate refs for ALL categories (one file per category).")
     p.add_argument("--dump-categories", action="store_true",
                    help="Just print category counts and exit.")
-    p.add_argument("--arch", default="x86_64", help="Flatpak arch (default: x86_64)")
+    p.add_argument("--arch", dest="arches", action="append",
+                   help="Flatpak arch (repeatable, default: x86_64). Refs are written for each arch")
+    p.add_argument("--require-all-arches", action="store_true",
+                   help="With several --arch, keep only apps available on every one of them")
     p.add_argument("--branch", default="stable", help="Flatpak branch (default: stable)")
     p.add_argument("--out", default="refs", help="Output directory for *.refs files (default: refs)")
     p.add_argument("--merge-to", default=None,
                    help="If set, merge refs from the selected categories into a single file with this name")
+    p.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                   help=f"Directory for the cached AppStream feed (default: {DEFAULT_CACHE_DIR})")
+    p.add_argument("--no-cache", dest="cache_dir", action="store_const", const=None,
+                   help="Always download the feed and do not touch the cache")
+    p.add_argument("--max-age", type=float, default=0.0,
+                   help="Use the cached feed without revalidating if checked less than this many seconds ago (default: 0)")
+    p.add_argument("--reindex", action="store_true",
+                   help="Rebuild the component index even if the feed did not change")
     args = p.parse_args()
 
     if not args.dump_categories and not args.all and not args.categories:
         print("Nothing to do. Use --dump-categories, --all, or -c/--category.", file=sys.stderr)
         sys.exit(2)
 
-    xml_bytes = fetch_appstream(args.arch)
-
-    # Build: cat -> set(app_ids)
-    by_cat = defaultdict(set)
-    cat_counter = Counter()
-
-    # We’ll include only desktop apps and apps with plausible IDs.
-    for comp in iter_components(xml_bytes):
-        app_id = comp.get("id", "")
-        ctype = comp.get("type", "")
-        cats = comp.get("categories", []) or []
-
-        if not app_id or "." not in app_id:
-            continue  # skip garbage IDs
-
-        # Restrict to apps; you can relax this if you want extensions/addons
-        if ctype and ctype not in ("desktop", "desktop-application", "console-application", "web-application", "agile"):
-            # AppStream varies; we keep the common interactive types.
-            pass  # not strictly filtering by type; flathub contains mixed types; keep flexibility
-
-        # Track category counts
-        for c in cats:
-            cat_counter[normalize_category(c)] += 1
-
-        # Assign the app to each normalized category it declares
-        for c in cats:
-            by_cat[normalize_category(c)].add(app_id)
+    arches = list(dict.fromkeys(args.arches or ["x86_64"]))
+    with closing(open_index(args.cache_dir)) as db:
+        update_index(db, arches, args.cache_dir, max_age=args.max_age, reindex=args.reindex)
+        write_refs(db, args, arches)
 
+def write_refs(db: sqlite3.Connection, args, arches) -> None:
     if args.dump_categories:
         print("== Category counts ==")
-        for cat, cnt in cat_counter.most_common():
-            print(f"{cat:20} {cnt}")
+        if len(arches) > 1:
+            print(f"{'':20} " + " ".join(f"{a:>10}" for a in arches))
+        for cat, counts in category_counts(db, arches):
+            print(f"{cat:20} " + " ".join(f"{n:>10}" if len(arches) > 1 else str(n) for n in counts))
         return
 
     os.makedirs(args.out, exist_ok=True)
@@ -140,26 +341,29 @@ def main():
                 f.write(line + "\n")
         print(f"Wrote {path}  ({len(uniq)} refs)")
 
+    def refs_for(cat):
+        return category_refs(db, cat, arches, args.branch, require_all=args.require_all_arches)
+
     if args.all:
-        for cat, ids in sorted(by_cat.items()):
-            refs = [make_ref(i, args.arch, args.branch) for i in ids]
-            write_file(os.path.join(args.out, f"{cat}.refs"), refs)
+        for cat in indexed_categories(db, arches):
+            write_file(os.path.join(args.out, f"{cat}.refs"), refs_for(cat))
         return
 
     # Specific categories
     selected = [normalize_category(c) for c in (args.categories or [])]
-    unknown = [c for c in selected if c not in by_cat]
+    known = set(indexed_categories(db, arches))
+    unknown = [c for c in selected if c not in known]
     if unknown:
         print("Warning: no matches for categories:", ", ".join(unknown), file=sys.stderr)
 
     if args.merge_to:
         merged = []
         for c in selected:
-            merged.extend(make_ref(i, args.arch, args.branch) for i in by_cat.get(c, []))
+            merged.extend(refs_for(c))
         write_file(os.path.join(args.out, args.merge_to), merged)
     else:
         for c in selected:
-            refs = [make_ref(i, args.arch, args.branch) for i in by_cat.get(c, [])]
+            refs = refs_for(c)
             if not refs:
                 print(f"Note: {c} had 0 refs.", file=sys.stderr)
             write_file(os.path.join(args.out, f"{c}.refs"), refs)
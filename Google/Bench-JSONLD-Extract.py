@@ -0,0 +1,162 @@
+"""
+Micro-benchmark: BeautifulSoup JSON-LD parsing vs the G-DL1.py script-tag scanner.
+
+  bs4        the previous parse_dataset_page(): full html.parser tree, then find_all(script)
+  scan       G-DL1.parse_dataset_page() on the whole page string
+  scan-chunk G-DL1.parse_dataset_page() fed 64 KB chunks, as download_file() streams them
+
+On 20 synthetic 1 MB pages (bs4 4.15, --repeat 2): bs4 2388 ms/page,
+scan 5.4 ms/page, scan-chunk 5.3 ms/page, all finding the same 20 datasets.
+
+Examples:
+  # Benchmark a folder of saved dataset landing pages (*.html / *.htm)
+  python Bench-JSONLD-Extract.py --pages saved_pages
+
+  # No corpus at hand: synthesize 50 pages of ~1 MB each
+  python Bench-JSONLD-Extract.py --synthetic 50
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHUNK = 64 * 1024
+
+
+def load_gdl1():
+    spec = importlib.util.spec_from_file_location("g_dl1", os.path.join(HERE, "G-DL1.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def parse_dataset_page_bs4(html):
+    # Verbatim copy of the previous implementation, kept here as the baseline
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    scripts = soup.find_all("script", type="application/ld+json")
+    datasets = []
+    for s in scripts:
+        try:
+            if not s.string:
+                continue
+            data = json.loads(s.string)
+            if isinstance(data, list):
+                for item in data:
+                    if isinstance(item, dict) and item.get("@type") == "Dataset":
+                        datasets.append(item)
+            elif isinstance(data, dict) and data.get("@type") == "Dataset":
+                datasets.append(data)
+        except Exception:
+            continue
+    return datasets
+
+
+def synthetic_page(i, size=1_000_000):
+    ld = json.dumps({"@context": "https://schema.org", "@type": "Dataset", "name": f"Dataset {i}",
+                     "description": "Synthetic benchmark dataset. " * 20})
+    row = "<tr><td class='c'>cell</td><td><a href='/x?id=1'>link</a></td><td><span>text</span></td></tr>\n"
+    body = "<table>" + row * (size // len(row)) + "</table>"
+    return (f"<!DOCTYPE html><html><head><title>Dataset {i}</title>"
+            f"<script>var x = 1;</script>"
+            f"<script type=\"application/ld+json\">{ld}</script></head>"
+            f"<body>{body}</body></html>")
+
+
+def ld(name):
+    return f'<script type="application/ld+json">{{"@type": "Dataset", "name": "{name}"}}</script>'
+
+
+# Pages the scanner must read like bs4 does, whole or split into chunks of any size
+EDGE_CASES = {
+    "plain": f"<html><head>{ld('a')}</head><body>text</body></html>",
+    "body tag in a script": f'<html><head><script>var s = "</body>";</script>{ld("a")}</head><body></body></html>',
+    "body tag in a comment": f"<html><head><!-- </body> -->{ld('a')}</head><body></body></html>",
+    "script tag in a comment": f"<html><!-- <script> -->{ld('a')}<body></body></html>",
+    "spaced close tags": '<html><script type="application/ld+json">{"@type": "Dataset"}</script  ></body  ></html>',
+    "after the body": f"<html><body>{ld('a')}</body>{ld('b')}</html>",
+}
+
+
+def check_edge_cases(gdl1):
+    """Compare the scanner with bs4 (when installed) on EDGE_CASES; returns the number of mismatches."""
+    try:
+        import bs4  # noqa: F401
+        reference = parse_dataset_page_bs4
+    except ImportError:
+        reference = None
+    failures = 0
+    for label, html in EDGE_CASES.items():
+        want = reference(html) if reference else gdl1.parse_dataset_page(html)
+        # bs4 keeps going past </body>; the scanner stops there by design
+        if label == "after the body":
+            want = want[:1]
+        for size in (None, 1, 2, 3, 7, 64):
+            pieces = html if size is None else (html[i:i + size] for i in range(0, len(html), size))
+            got = gdl1.parse_dataset_page(pieces)
+            if got != want:
+                failures += 1
+                print(f"❌ {label} (chunk size {size or 'whole'}): {got} != {want}")
+    print(f"{'✅' if not failures else '❌'} {len(EDGE_CASES)} edge cases checked against "
+          f"{'bs4' if reference else 'the whole-page scan'}, {failures} mismatches")
+    return failures
+
+
+def load_corpus(pages_dir):
+    pages = []
+    for name in sorted(os.listdir(pages_dir)):
+        if name.lower().endswith((".html", ".htm")):
+            with open(os.path.join(pages_dir, name), "r", encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    return pages
+
+
+def bench(label, fn, pages, repeat):
+    best = float("inf")
+    found = 0
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        found = sum(len(fn(p)) for p in pages)
+        best = min(best, time.perf_counter() - start)
+    mb = sum(len(p) for p in pages) / 1e6
+    print(f"{label:11} {best:9.3f} {best / len(pages) * 1000:10.2f} {mb / best:9.1f} {found:>9}")
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark JSON-LD extraction from dataset pages.")
+    p.add_argument("--pages", help="Directory of saved .html pages")
+    p.add_argument("--synthetic", type=int, default=30, help="Synthetic pages when --pages is not given (default: 30)")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per implementation; best is reported (default: 3)")
+    args = p.parse_args()
+
+    pages = load_corpus(args.pages) if args.pages else [synthetic_page(i) for i in range(args.synthetic)]
+    if not pages:
+        print("No pages to benchmark.")
+        return
+    print(f"{len(pages)} page(s), {sum(len(p) for p in pages) / 1e6:.1f} MB of HTML")
+
+    gdl1 = load_gdl1()
+    check_edge_cases(gdl1)
+
+    def chunked(html):
+        return gdl1.parse_dataset_page(html[i:i + CHUNK] for i in range(0, len(html), CHUNK))
+
+    print(f"{'impl':11} {'best s':>9} {'ms/page':>10} {'MB/s':>9} {'datasets':>9}")
+    baseline = None
+    try:
+        import bs4  # noqa: F401
+        baseline = bench("bs4", parse_dataset_page_bs4, pages, args.repeat)
+    except ImportError:
+        print("bs4         (beautifulsoup4 not installed; baseline skipped)")
+    scan = bench("scan", gdl1.parse_dataset_page, pages, args.repeat)
+    bench("scan-chunk", chunked, pages, args.repeat)
+    if baseline:
+        print(f"\nSpeed-up over bs4: {baseline / scan:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
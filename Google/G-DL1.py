@@ -1,18 +1,29 @@
+import hashlib
 import json
 import os
-import requests
+import re
 import time
 import random
-from urllib.parse import urlparse, urljoin, parse_qs
-from bs4 import BeautifulSoup
+import sys
+from urllib.parse import urlparse, urljoin, parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
 
-# Load dataset links from JSON
-with open("google_datasets.json", "r", encoding="utf-8") as f:
-    dataset_info = json.load(f)
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
 
-# Create a folder for downloads
+# Folder for downloads
 DATASET_DIR = "Datasets"
-os.makedirs(DATASET_DIR, exist_ok=True)
+# One fetched result per canonical URL, shared by every topic that links to it
+SHARED_DIR = os.path.join(DATASET_DIR, "_shared")
+
+# Query parameters that only track clicks and never change the page
+TRACKING_PARAMS = {
+    "gclid", "dclid", "gbraid", "wbraid", "fbclid", "msclkid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ved", "usg", "ei", "yclid", "igshid",
+}
+
+# Landing pages are stable; re-running a parser change re-reads them from disk
+session = CachedSession("google_datasets", ttl=30 * 86400)
 
 # Basic browser headers
 HEADERS = {
@@ -23,6 +34,12 @@ HEADERS = {
 
 
 def normalize_url(url):
+    """Canonicalize url so every spelling of the same page maps to one string.
+
+    Resolves schemeless/relative links, unwraps (nested) Google /url redirects,
+    lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, and sorts the query. Returns None for unwanted URLs.
+    """
     if not url:
         return None
     url = url.strip()
@@ -35,14 +52,17 @@ def normalize_url(url):
     # Resolve relative against Google
     if url.startswith("/"):
         url = urljoin("https://www.google.com", url)
-    # After initial normalization, unwrap Google redirect /url?q=...
+    # After initial normalization, unwrap Google redirects /url?q=... (or ?url=...), possibly nested
     try:
-        pu = urlparse(url)
-        if pu.netloc in ("www.google.com", "google.com") and pu.path == "/url":
+        for _ in range(5):
+            pu = urlparse(url)
+            if pu.netloc not in ("www.google.com", "google.com") or pu.path != "/url":
+                break
             qs = parse_qs(pu.query)
-            target = qs.get("q", [None])[0]
-            if target and target.startswith(("http://", "https://")):
-                url = target
+            target = (qs.get("q") or qs.get("url") or [None])[0]
+            if not (target and target.startswith(("http://", "https://"))):
+                break
+            url = target
     except Exception:
         pass
     # Filter out obvious non-http(s)
@@ -56,7 +76,31 @@ def normalize_url(url):
             return None
     except Exception:
         return None
-    return url
+    try:
+        pu = urlsplit(url)
+        scheme = pu.scheme.lower()
+        netloc = (pu.hostname or "").lower()
+        if pu.port and (scheme, pu.port) not in (("http", 80), ("https", 443)):
+            netloc += f":{pu.port}"
+        query = sorted(
+            (k, v) for k, v in parse_qsl(pu.query, keep_blank_values=True)
+            if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+        )
+        return urlunsplit((scheme, netloc, pu.path or "/", urlencode(query), ""))
+    except ValueError:
+        return None
+
+
+def shared_result_path(canonical_url):
+    digest = hashlib.sha1(canonical_url.encode("utf-8")).hexdigest()[:20]
+    return os.path.join(SHARED_DIR, f"{digest}.json")
+
+
+def write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
 
 
 def safe_filename(topic, url, ext=".json"):
@@ -73,22 +117,81 @@ def safe_filename(topic, url, ext=".json"):
 
 # Parse dataset JSON-LD from HTML
 
+LD_JSON_OPEN_RE = re.compile(r"<script\b[^>]*\stype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>", re.I)
+# Everything the scanner has to step over: a comment or script may contain "</body>" as text
+MARKUP_RE = re.compile(r"<!--|<script\b[^>]*>|</body\s*>", re.I)
+SCRIPT_CLOSE_RE = re.compile(r"</script\s*>", re.I)
+COMMENT_CLOSE_RE = re.compile(r"-->")
+
+
+def iter_ld_json(chunks):
+    """Yield the raw body of each <script type="application/ld+json"> in HTML.
+
+    chunks is the page as a str or an iterable of str pieces (e.g. a streamed
+    response). Only script tags and comments are located, nothing else is parsed,
+    and reading stops at </body> so the rest of a streamed response is never downloaded.
+    """
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    buf = ""
+    close = None  # end pattern of the script or comment being read, if any
+    keep = False  # whether that element is an ld+json script
+    scan_from = 0
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            if close:
+                m = close.search(buf, scan_from)
+                if not m:
+                    if close is SCRIPT_CLOSE_RE:
+                        # Rescan from the last "<": a split </script  > can be any length
+                        lt = buf.rfind("<", scan_from)
+                        scan_from = lt if lt != -1 else len(buf)
+                    else:
+                        scan_from = max(scan_from, len(buf) - 2)
+                    if not keep:
+                        # Skipped content is not needed, only a possibly split end tag
+                        buf, scan_from = buf[scan_from:], 0
+                    break
+                if keep:
+                    yield buf[:m.start()]
+                buf = buf[m.end():]
+                close = None
+                scan_from = 0
+                continue
+            m = MARKUP_RE.search(buf)
+            if not m:
+                # Keep only a possibly split tag at the end of the buffer
+                lt = buf.rfind("<")
+                buf = buf[lt:] if lt != -1 else ""
+                break
+            tag = m.group()
+            if tag.startswith("</"):
+                return
+            buf = buf[m.end():]
+            if tag == "<!--":
+                close, keep = COMMENT_CLOSE_RE, False
+            else:
+                close, keep = SCRIPT_CLOSE_RE, bool(LD_JSON_OPEN_RE.match(tag))
+            scan_from = 0
+
+
+def datasets_in_ld_json(data):
+    # Some pages embed arrays of things or an @graph container; normalize to a list
+    if isinstance(data, dict) and isinstance(data.get("@graph"), list):
+        data = data["@graph"]
+    items = data if isinstance(data, list) else [data]
+    return [item for item in items if isinstance(item, dict) and item.get("@type") == "Dataset"]
+
+
 def parse_dataset_page(html):
-    soup = BeautifulSoup(html, "html.parser")
-    scripts = soup.find_all("script", type="application/ld+json")
+    """Return the schema.org Dataset objects embedded as JSON-LD in a page (str or str chunks)."""
     datasets = []
-    for s in scripts:
+    for body in iter_ld_json(html):
         try:
-            if not s.string:
+            if not body.strip():
                 continue
-            data = json.loads(s.string)
-            # Some pages embed arrays of things; normalize to a list
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and item.get("@type") == "Dataset":
-                        datasets.append(item)
-            elif isinstance(data, dict) and data.get("@type") == "Dataset":
-                datasets.append(data)
+            datasets.extend(datasets_in_ld_json(json.loads(body)))
         except Exception:
             continue
     return datasets
@@ -96,47 +199,84 @@ def parse_dataset_page(html):
 # Function to download datasets (fetch and parse JSON-LD)
 
 def download_file(url, topic):
+    """Link topic to the shared result for url, fetching it only if no run has yet.
+
+    Returns True when a network request was made, so callers only pace real fetches.
+    Responses come through the shared HTTP cache, so a hit there costs nothing either.
+    """
+    fetched = False
     try:
         norm = normalize_url(url)
         if not norm:
             print(f"⏭️ Skipping invalid or unwanted URL: {url}")
-            return
-        parsed_url = urlparse(norm)
+            return fetched
         filename = os.path.join(DATASET_DIR, safe_filename(topic, norm, ext=".json"))
+        shared_path = shared_result_path(norm)
 
-        print(f"⬇️ Downloading: {norm}")
-        response = requests.get(norm, headers=HEADERS, timeout=25)
-        response.raise_for_status()
-
-        html = response.text
-        datasets = parse_dataset_page(html)
+        if os.path.exists(shared_path):
+            with open(shared_path, "r", encoding="utf-8") as f:
+                datasets = json.load(f).get("datasets", [])
+            print(f"♻️ Already fetched: {norm}")
+        else:
+            print(f"⬇️ Downloading: {norm}")
+            fetched = True
+            with session.get(norm, headers=HEADERS, timeout=25, stream=True) as response:
+                fetched = not response.from_cache
+                response.raise_for_status()
+                response.encoding = response.encoding or "utf-8"
+                # Scan the streamed body; the extractor stops reading after </body>
+                chunks = response.iter_content(chunk_size=64 * 1024, decode_unicode=True)
+                datasets = parse_dataset_page(chunks)
+                if fetched and not session.disabled:
+                    # The cache stores a streamed body only once it is read to the end
+                    for _ in chunks:
+                        pass
+                final_url = response.url
 
-        # Save the JSON-LD datasets (even if empty list)
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump({
-                "topic": topic,
+            # Save the JSON-LD datasets (even if empty list) once per canonical URL
+            write_json(shared_path, {
                 "source_url": norm,
+                "final_url": final_url,
                 "extracted_at": int(time.time()),
                 "datasets": datasets,
-            }, f, ensure_ascii=False, indent=2)
+            })
+
+        # The per-topic file only references the shared result
+        write_json(filename, {
+            "topic": topic,
+            "source_url": norm,
+            "shared_result": os.path.relpath(shared_path, DATASET_DIR).replace(os.sep, "/"),
+            "dataset_count": len(datasets),
+        })
 
         if datasets:
-            print(f"✅ Saved metadata for {len(datasets)} dataset(s): {filename}\n")
+            print(f"✅ Linked metadata for {len(datasets)} dataset(s): {filename}\n")
         else:
             print(f"ℹ️ No dataset JSON-LD found; saved placeholder JSON: {filename}\n")
 
     except Exception as e:
         print(f"❌ Failed to download {url}: {e}")
+    return fetched
+
+def main():
+    # Load dataset links from JSON
+    with open("google_datasets.json", "r", encoding="utf-8") as f:
+        dataset_info = json.load(f)
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+
+    # Loop through datasets and download files
+    for topic, datasets in dataset_info.items():
+        print(f"\n🔍 Downloading datasets for: {topic}")
+
+        for dataset in datasets:
+            dataset_link = dataset.get("link")
+            # Randomized delay between requests to reduce rate limiting; cache hits need none
+            if dataset_link and download_file(dataset_link, topic):
+                time.sleep(random.uniform(5, 15))
 
-# Loop through datasets and download files
-for topic, datasets in dataset_info.items():
-    print(f"\n🔍 Downloading datasets for: {topic}")
+    print("\n✅ All possible datasets downloaded!")
 
-    for dataset in datasets:
-        dataset_link = dataset.get("link")
-        if dataset_link:
-            download_file(dataset_link, topic)
-            # Randomized delay between requests to reduce rate limiting
-            time.sleep(random.uniform(5, 15))
 
-print("\n✅ All possible datasets downloaded!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
+import argparse
+import os
+import queue
 import requests
+import threading
 from bs4 import BeautifulSoup
 import json
 import time
 import random
+import sys
+
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
 
 # Load structured search topics JSON
 TOPIC_JSON_FILE = "search_topics.json"
@@ -10,6 +19,9 @@ TOPIC_JSON_FILE = "search_topics.json"
 # Google SERP with site filter to Dataset Search results
 GOOGLE_SEARCH_URL = "https://www.google.com/search?q=site%3Adatasetsearch.research.google.com+{}&num=10&hl=en"
 
+# SERPs are reused for a day; block/consent pages are evicted as soon as they are detected
+session = CachedSession("google_serp", ttl=86400)
+
 # Headers to pretend we're a real browser
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
@@ -46,42 +58,73 @@ except json.JSONDecodeError as e:
     print(f"❌ Failed to parse {TOPIC_JSON_FILE}: {e}. Nothing to search.")
     search_topics = []
 
-# Function to search Google Dataset Search
-def search_google_datasets(query):
+# Outcomes of a single SERP request, as seen by the scheduler
+OK, EMPTY, BLOCKED, FAILED = "ok", "empty", "blocked", "failed"
+
+
+def build_search_url(query, basic=False):
     # Use quoted term to reduce noise
     formatted_query = ('"' + query.replace('"', ' ') + '"').replace(" ", "+")
-    base_url = GOOGLE_SEARCH_URL.format(formatted_query)
-
-    print(f"\n🔍 Searching: {query}")
-
-    def fetch(url):
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=20)
-            return resp
-        except requests.RequestException as e:
-            print(f"❌ Request error for {query}: {e}")
-            return None
-
-    def is_blocked(resp_text, resp_url):
-        tl = resp_text.lower()
-        return (
-            "unusual traffic" in tl or
-            "recaptcha" in tl or
-            "verify you're not a robot" in tl or
-            "form action=\"https://consent.google.com/save\"" in tl or
-            (resp_url and "consent.google.com" in resp_url)
-        )
+    url = GOOGLE_SEARCH_URL.format(formatted_query)
+    # gbv=1 asks for the basic HTML page, which parses when the standard one does not
+    return url + "&gbv=1" if basic else url
 
-    def parse_results(soup_obj):
-        items = []
-        # Prefer standard containers
-        containers = soup_obj.select("div.tF2Cxc, div.g, div#search div.g")
-        for c in containers:
-            a_tag = c.select_one("a[href]")
-            title_el = c.select_one("h3")
-            if not a_tag or not title_el:
-                continue
-            href = a_tag.get("href", "")
+
+def fetch(url, query):
+    try:
+        resp = session.get(url, headers=HEADERS, timeout=20)
+        return resp
+    except requests.RequestException as e:
+        print(f"❌ Request error for {query}: {e}")
+        return None
+
+
+def is_blocked(resp_text, resp_url):
+    tl = resp_text.lower()
+    return (
+        "unusual traffic" in tl or
+        "recaptcha" in tl or
+        "verify you're not a robot" in tl or
+        "form action=\"https://consent.google.com/save\"" in tl or
+        (resp_url and "consent.google.com" in resp_url)
+    )
+
+
+def parse_results(soup_obj):
+    items = []
+    # Prefer standard containers
+    containers = soup_obj.select("div.tF2Cxc, div.g, div#search div.g")
+    for c in containers:
+        a_tag = c.select_one("a[href]")
+        title_el = c.select_one("h3")
+        if not a_tag or not title_el:
+            continue
+        href = a_tag.get("href", "")
+        # Normalize Google redirect links
+        if href.startswith("/url?"):
+            from urllib.parse import urlparse, parse_qs
+            qs = parse_qs(urlparse(href).query)
+            real = qs.get("q", [""])[0]
+            if real.startswith("http"):
+                href = real
+        # Only keep Dataset Search links
+        if "datasetsearch.research.google.com" not in href:
+            continue
+        desc_el = (
+            c.select_one("div.IsZvec") or
+            c.select_one("div.VwiC3b") or
+            c.select_one("span.aCOpRe") or
+            c.select_one("div span")
+        )
+        items.append({
+            "title": title_el.get_text(strip=True),
+            "link": href,
+            "description": desc_el.get_text(strip=True) if desc_el else "No description available",
+        })
+    # If still empty, scan all anchors as a fallback
+    if not items:
+        for a in soup_obj.select("a[href]"):
+            href = a.get("href", "")
             # Normalize Google redirect links
             if href.startswith("/url?"):
                 from urllib.parse import urlparse, parse_qs
@@ -89,86 +132,180 @@ def search_google_datasets(query):
                 real = qs.get("q", [""])[0]
                 if real.startswith("http"):
                     href = real
-            # Only keep Dataset Search links
             if "datasetsearch.research.google.com" not in href:
                 continue
+            title_el = a.select_one("h3") or a
+            title = title_el.get_text(strip=True)
+            if not title:
+                continue
+            # Try to find nearby description
+            parent = a.find_parent(["div", "li"]) or soup_obj
             desc_el = (
-                c.select_one("div.IsZvec") or
-                c.select_one("div.VwiC3b") or
-                c.select_one("span.aCOpRe") or
-                c.select_one("div span")
+                parent.select_one("div.IsZvec") or parent.select_one("div.VwiC3b") or parent.select_one("span")
             )
             items.append({
-                "title": title_el.get_text(strip=True),
+                "title": title,
                 "link": href,
                 "description": desc_el.get_text(strip=True) if desc_el else "No description available",
             })
-        # If still empty, scan all anchors as a fallback
-        if not items:
-            for a in soup_obj.select("a[href]"):
-                href = a.get("href", "")
-                # Normalize Google redirect links
-                if href.startswith("/url?"):
-                    from urllib.parse import urlparse, parse_qs
-                    qs = parse_qs(urlparse(href).query)
-                    real = qs.get("q", [""])[0]
-                    if real.startswith("http"):
-                        href = real
-                if "datasetsearch.research.google.com" not in href:
-                    continue
-                title_el = a.select_one("h3") or a
-                title = title_el.get_text(strip=True)
-                if not title:
-                    continue
-                # Try to find nearby description
-                parent = a.find_parent(["div", "li"]) or soup_obj
-                desc_el = (
-                    parent.select_one("div.IsZvec") or parent.select_one("div.VwiC3b") or parent.select_one("span")
-                )
-                items.append({
-                    "title": title,
-                    "link": href,
-                    "description": desc_el.get_text(strip=True) if desc_el else "No description available",
-                })
-        return items
-
-    # First attempt: standard HTML
-    resp = fetch(base_url)
+    return items
+
+
+def search_attempt(query, basic=False):
+    """Run one SERP request for query. Returns (outcome, results)."""
+    url = build_search_url(query, basic=basic)
+    resp = fetch(url, query)
     if resp is None:
-        return []
+        return FAILED, []
+    if resp.status_code == 429 or is_blocked(resp.text, getattr(resp, 'url', '')):
+        session.invalidate(url)
+        return BLOCKED, []
     if resp.status_code != 200:
         print(f"❌ Failed to fetch results for {query}. Status Code: {resp.status_code}")
-        return []
-    if is_blocked(resp.text, getattr(resp, 'url', '')):
-        print(f"⛔ Request appears blocked/consent wall for '{query}'. Skipping.")
-        return []
+        return FAILED, []
+    results = parse_results(BeautifulSoup(resp.text, "html.parser"))
+    return (OK if results else EMPTY), results
+
+
+class RequestBudget:
+    """Global politeness budget shared by all workers.
+
+    Requests are spaced 60/per_minute seconds apart with +/- jitter, and a block
+    pauses every worker with exponential back-off until a request succeeds again.
+    """
+
+    def __init__(self, per_minute, jitter=0.5, backoff=120.0, max_backoff=1800.0):
+        self.interval = 60.0 / per_minute
+        self.jitter = jitter
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self._next = 0.0
+        self._paused_until = 0.0
+        self._strikes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next, self._paused_until)
+            spacing = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self._next = start + spacing
+        time.sleep(max(0.0, start - time.monotonic()))
+
+    def blocked(self):
+        with self._lock:
+            delay = min(self.max_backoff, self.base_backoff * (2 ** self._strikes))
+            self._strikes += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def succeeded(self):
+        with self._lock:
+            self._strikes = 0
+
+
+def save_results(path, results):
+    # Write to a temp file and swap it in so a partial run always leaves valid JSON
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    os.replace(tmp, path)
+
+
+def run_searches(topics, output_file, per_minute, workers, max_attempts, resume=False):
+    """Search topics concurrently under one RequestBudget, saving after every topic."""
+    all_datasets = {}
+    if resume and os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            all_datasets = json.load(f)
+        print(f"↩️ Resuming: {len(all_datasets)} topics already in {output_file}")
+
+    budget = RequestBudget(per_minute)
+    lock = threading.Lock()
+    work = queue.Queue()
+    pending = [t for t in topics if t not in all_datasets]
+    for topic in pending:
+        work.put((topic, False, 1))
+
+    def finish(topic, results):
+        with lock:
+            all_datasets[topic] = results
+            save_results(output_file, all_datasets)
+            print(f"💾 [{len(all_datasets)}/{len(topics)}] {topic}: {len(results)} result(s)")
+
+    def handle(topic, basic, attempt):
+        # Cached SERPs cost no request, so they skip the budget
+        if not session.is_cached(build_search_url(topic, basic=basic)):
+            budget.acquire()
+        print(f"\n🔍 Searching{' (basic HTML)' if basic else ''}: {topic}")
+        outcome, results = search_attempt(topic, basic=basic)
+        if outcome == OK:
+            budget.succeeded()
+            finish(topic, results)
+        elif outcome == EMPTY and not basic:
+            budget.succeeded()
+            # Fallback: basic HTML (gbv=1) as its own budgeted request
+            work.put((topic, True, attempt))
+        elif outcome == EMPTY:
+            print(f"⚠️ No results parsed for '{topic}'. Google may have changed markup.")
+            finish(topic, [])
+        elif attempt < max_attempts:
+            if outcome == BLOCKED:
+                delay = budget.blocked()
+                print(f"⛔ Blocked/consent wall on '{topic}'. Pausing all workers {delay:.0f}s and requeueing.")
+            work.put((topic, basic, attempt + 1))
+        else:
+            # Not recorded, so --resume retries it next run
+            print(f"❌ Giving up on '{topic}' after {attempt} attempt(s).")
+
+    def worker():
+        while True:
+            topic, basic, attempt = work.get()
+            if topic is None:
+                work.task_done()
+                return
+            try:
+                handle(topic, basic, attempt)
+            except Exception as e:
+                # Not recorded, so --resume retries it next run; the worker keeps going
+                print(f"❌ Error on '{topic}': {e}")
+            finally:
+                # Always, or work.join() below would wait forever
+                work.task_done()
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    results = parse_results(soup)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    work.join()
+    for _ in threads:
+        work.put((None, False, 0))
+    for t in threads:
+        t.join()
+    return all_datasets
 
-    # Fallback: basic HTML (gbv=1) if nothing parsed
-    if not results:
-        basic_url = base_url + "&gbv=1"
-        resp2 = fetch(basic_url)
-        if resp2 and resp2.status_code == 200 and not is_blocked(resp2.text, getattr(resp2, 'url', '')):
-            soup2 = BeautifulSoup(resp2.text, "html.parser")
-            results = parse_results(soup2)
 
-    if not results:
-        print(f"⚠️ No results parsed for '{query}'. Google may have changed markup or blocked the request.")
+def positive_float(value):
+    rate = float(value)
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return rate
 
-    return results
 
-# Run searches and store results
-all_datasets = {}
+def main():
+    parser = argparse.ArgumentParser(description="Search Google for Dataset Search pages per topic")
+    parser.add_argument("--output", default="google_datasets.json", help="Output JSON file (default: google_datasets.json)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent searches (default: 4)")
+    parser.add_argument("--rate", type=positive_float, default=6.0,
+                        help="Global request budget in requests per minute, jittered (default: 6)")
+    parser.add_argument("--max-attempts", type=int, default=4,
+                        help="Attempts per topic on blocks or request errors before giving up (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="Skip topics already present in the output file")
+    args = parser.parse_args()
 
-for topic in search_topics:
-    # Randomized delay between requests to reduce rate limiting
-    time.sleep(random.uniform(5, 15))
-    all_datasets[topic] = search_google_datasets(topic)
+    all_datasets = run_searches(search_topics, args.output, args.rate, args.workers, args.max_attempts,
+                                resume=args.resume)
+    print(f"\n✅ {len(all_datasets)} topic(s) saved to {args.output}")
 
-# Save results to JSON
-with open("google_datasets.json", "w", encoding="utf-8") as f:
-    json.dump(all_datasets, f, indent=4)
 
-print("\n✅ All dataset links saved to google_datasets.json")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
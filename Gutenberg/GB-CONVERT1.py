@@ -0,0 +1,35 @@
+import argparse
+import json
+
+from token_shards import ShardWriter
+
+# TinyLlama's vocabulary; token ids fit in uint16
+DEFAULT_VOCAB_SIZE = 32000
+TOKENIZER_NAME = "TinyLlama/TinyLlama-1.1B-intermediate-step-1431k-3T"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a tokenized JSONL file into memory-mappable token shards")
+    parser.add_argument("--input", default="Gutenberg-Books-Tokenized.jsonl", help="JSONL with an input_ids list per line")
+    parser.add_argument("--output", default="Gutenberg-Books-Tokenized", help="Shard directory to write")
+    parser.add_argument("--vocab-size", type=int, default=DEFAULT_VOCAB_SIZE,
+                        help=f"Tokenizer vocabulary size; picks uint16 or uint32 storage (default: {DEFAULT_VOCAB_SIZE})")
+    parser.add_argument("--tokenizer", default=TOKENIZER_NAME, help="Tokenizer name recorded in shard metadata")
+    parser.add_argument("--shard-size-mb", type=int, default=512, help="Target size of each token shard (default: 512)")
+    args = parser.parse_args()
+
+    samples = 0
+    # Stream line by line so the JSONL file never has to fit in memory
+    with open(args.input, "r", encoding="utf-8") as f_in, \
+            ShardWriter(args.output, args.vocab_size, tokenizer_name=args.tokenizer,
+                        max_shard_bytes=args.shard_size_mb * 1024 * 1024) as writer:
+        for line in f_in:
+            if line.strip():
+                writer.add(json.loads(line)["input_ids"])
+                samples += 1
+
+    print(f"🎉 Converted {samples} samples into {len(writer.shards)} shard(s) in `{args.output}/`")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,121 @@
+import argparse
+import codecs
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import gutenbergpy.textget
 
-# ✅ Load Book IDs from the File
-with open("Gutenberg-Book-Ids.txt", "r") as f:
-    book_ids = [line.strip() for line in f.readlines()]
+BOOKS_DIR = "Gutenberg-Books"
+# One JSON line per saved book: {"id", "bytes", "sha256"}; the last line for an id wins
+MANIFEST = os.path.join(BOOKS_DIR, "manifest.jsonl")
+CHUNK = 1024 * 1024
+
+
+def load_manifest():
+    entries = {}
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[str(entry["id"])] = entry
+                except (ValueError, KeyError):
+                    continue  # torn last line from an interrupted run
+    return entries
+
 
-print(f"📥 Downloading {len(book_ids)} books from Project Gutenberg...")
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-for book_id in book_ids:
+
+def is_verified(book_id, entry, full_check):
+    """True if Book_<id>.txt matches its manifest entry (size, plus sha256 when full_check)."""
+    path = os.path.join(BOOKS_DIR, f"Book_{book_id}.txt")
+    if not entry or not os.path.exists(path) or os.path.getsize(path) != entry.get("bytes"):
+        return False
+    return not full_check or sha256_file(path) == entry.get("sha256")
+
+
+def save_book(book_id, data):
+    """Write the book atomically, checking it is UTF-8 without decoding it as a whole."""
+    path = os.path.join(BOOKS_DIR, f"Book_{book_id}.txt")
+    tmp = path + ".part"
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    h = hashlib.sha256()
+    view = memoryview(data)
     try:
-        print(f"📖 Downloading Book ID: {book_id}")
+        with open(tmp, "wb") as f:
+            for i in range(0, len(view), CHUNK):
+                piece = view[i:i + CHUNK]
+                decoder.decode(piece)
+                h.update(piece)
+                f.write(piece)
+            decoder.decode(b"", final=True)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {"id": book_id, "bytes": len(data), "sha256": h.hexdigest()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download Project Gutenberg books listed in Gutenberg-Book-Ids.txt")
+    parser.add_argument("--ids", default="Gutenberg-Book-Ids.txt", help="File with one book id per line")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads (default: 8)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Re-hash books already on disk instead of trusting the recorded size")
+    parser.add_argument("--force", action="store_true", help="Download every book even if already saved")
+    args = parser.parse_args()
+
+    # ✅ Load Book IDs from the File
+    with open(args.ids, "r") as f:
+        book_ids = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+    os.makedirs(BOOKS_DIR, exist_ok=True)
+    manifest = {} if args.force else load_manifest()
+    todo = [b for b in book_ids if args.force or not is_verified(b, manifest.get(b), args.verify)]
+    skipped = len(book_ids) - len(todo)
+
+    print(f"📥 Downloading {len(todo)} books from Project Gutenberg "
+          f"({skipped} already saved, {args.workers} workers)...")
+
+    saved = failed = total_bytes = 0
+    start = time.perf_counter()
+
+    def fetch(book_id):
         book_text = gutenbergpy.textget.get_text_by_id(int(book_id))
-        
-        # ✅ Save Each Book as a Text File
-        with open(f"Gutenberg-Books/Book_{book_id}.txt", "w", encoding="utf-8") as f:
-            f.write(book_text.decode("utf-8"))
+        return save_book(book_id, book_text)
+
+    with open(MANIFEST, "a", encoding="utf-8") as manifest_out, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(fetch, book_id): book_id for book_id in todo}
+        for future in as_completed(futures):
+            book_id = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ Failed to download Book ID {book_id}: {e}")
+                continue
+            manifest_out.write(json.dumps(entry) + "\n")
+            manifest_out.flush()
+            saved += 1
+            total_bytes += entry["bytes"]
+            print(f"📖 [{saved + failed}/{len(todo)}] Saved Book ID {book_id} ({entry['bytes'] / 1e6:.2f} MB)")
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"\n🎉 Done in {elapsed:.1f}s: {saved} downloaded, {skipped} skipped, {failed} failed.")
+    print(f"⚡ Throughput: {saved / elapsed:.2f} books/s, {total_bytes / 1e6 / elapsed:.2f} MB/s. "
+          f"Check the `{BOOKS_DIR}/` folder.")
 
-    except Exception as e:
-        print(f"❌ Failed to download Book ID {book_id}: {e}")
 
-print("\n🎉 All books downloaded successfully! Check the `Gutenberg-Books/` folder.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
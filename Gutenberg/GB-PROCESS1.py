@@ -1,20 +1,209 @@
+import argparse
 import json
-from transformers import AutoTokenizer
 import os
+import time
+from functools import partial
+from multiprocessing import Pool
 
-# ✅ Load TinyLlama Tokenizer
-tokenizer = AutoTokenizer.from_pretrained("TinyLlama/TinyLlama-1.1B-intermediate-step-1431k-3T")
+from token_shards import ShardWriter
 
-# ✅ Convert Books to JSONL Format
-output_file = "Gutenberg-Books-Tokenized.jsonl"
-with open(output_file, "w", encoding="utf-8") as f_out:
-    for book_file in os.listdir("Gutenberg-Books"):
-        if book_file.endswith(".txt"):
-            with open(f"Gutenberg-Books/{book_file}", "r", encoding="utf-8") as f_in:
-                text = f_in.read()
-                tokens = tokenizer.encode(text, truncation=True, max_length=2048)
+TOKENIZER_NAME = "TinyLlama/TinyLlama-1.1B-intermediate-step-1431k-3T"
+BOOKS_DIR = "Gutenberg-Books"
 
-                json.dump({"input_ids": tokens, "labels": tokens}, f_out)
-                f_out.write("\n")
+# Set once per worker process by init_worker()
+_tokenizer = None
 
-print(f"\n🎉 Tokenized books saved to `{output_file}`!")
\ No newline at end of file
+
+def load_tokenizer():
+    # ✅ Load TinyLlama Tokenizer
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+
+
+def init_worker():
+    global _tokenizer
+    _tokenizer = load_tokenizer()
+
+
+def tokenize_batch(paths, max_length, pack=False):
+    """Read a batch of books and tokenize them in one batched fast-tokenizer call.
+
+    With pack, whole books are kept and each ends with EOS so packed sequences
+    separate documents; otherwise books are truncated to max_length.
+    """
+    texts = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f_in:
+            texts.append(f_in.read())
+    if pack:
+        eos = _tokenizer.eos_token_id
+        return [ids + [eos] for ids in _tokenizer(texts, verbose=False)["input_ids"]]
+    return _tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+
+
+class SequencePacker:
+    """Split documents into seq_len windows and pack the leftover tails into shared sequences.
+
+    Windows advance by seq_len - overlap. A tail (always shorter than seq_len)
+    goes whole into the first open sequence it fits in (first-fit over a few
+    open sequences), so no tokens are dropped and documents are never cut twice.
+    """
+
+    OPEN_BINS = 8
+
+    def __init__(self, seq_len, overlap=0):
+        if not 0 <= overlap < seq_len:
+            raise ValueError(f"overlap must be in [0, {seq_len}), got {overlap}")
+        self.seq_len = seq_len
+        self.stride = seq_len - overlap
+        self.bins = []
+        self.sequences = 0
+        self.real_tokens = 0
+
+    @property
+    def efficiency(self):
+        """Distinct document tokens / total slots of the emitted fixed-length sequences (final after flush())."""
+        return self.real_tokens / (self.sequences * self.seq_len) if self.sequences else 0.0
+
+    def _emit(self, seq):
+        self.sequences += 1
+        return seq
+
+    def add(self, tokens):
+        """Feed one document; returns the sequences that are complete."""
+        # Overlap tokens repeated in a later window or the tail are counted once
+        self.real_tokens += len(tokens)
+        out = []
+        start = 0
+        while len(tokens) - start >= self.seq_len:
+            out.append(self._emit(tokens[start:start + self.seq_len]))
+            start += self.stride
+        # Tokens not already inside a window (the tail keeps the overlap as context)
+        covered = start - self.stride + self.seq_len if start else 0
+        if len(tokens) > covered:
+            out.extend(self._pack(tokens[start:]))
+        return out
+
+    def _pack(self, tail):
+        for seq in self.bins:
+            if len(seq) + len(tail) <= self.seq_len:
+                seq.extend(tail)
+                if len(seq) == self.seq_len:
+                    self.bins.remove(seq)
+                    return [self._emit(seq)]
+                return []
+        self.bins.append(list(tail))
+        if len(self.bins) > self.OPEN_BINS:
+            fullest = max(self.bins, key=len)
+            self.bins.remove(fullest)
+            return [self._emit(fullest)]
+        return []
+
+    def flush(self):
+        out = [self._emit(seq) for seq in self.bins]
+        self.bins = []
+        return out
+
+
+class JsonlWriter:
+    """One {"input_ids", "labels"} JSON object per line, the original output format."""
+
+    def __init__(self, path):
+        self.f_out = open(path, "w", encoding="utf-8")
+
+    def add(self, tokens):
+        json.dump({"input_ids": tokens, "labels": tokens}, self.f_out)
+        self.f_out.write("\n")
+
+    def close(self):
+        self.f_out.close()
+
+
+def iter_batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenize Gutenberg books with the TinyLlama tokenizer")
+    parser.add_argument("--input-dir", default=BOOKS_DIR, help=f"Folder of Book_<id>.txt files (default: {BOOKS_DIR})")
+    parser.add_argument("--format", choices=("jsonl", "shards"), default="jsonl",
+                        help="jsonl: input_ids/labels per line; shards: memory-mappable binary token shards")
+    parser.add_argument("--output", default=None,
+                        help="Output JSONL file or shard directory "
+                             "(default: Gutenberg-Books-Tokenized.jsonl / Gutenberg-Books-Tokenized)")
+    parser.add_argument("--shard-size-mb", type=int, default=512, help="Target size of each token shard (default: 512)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Tokenizer processes, each loading the tokenizer once (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Books per batched tokenizer call (default: 16)")
+    parser.add_argument("--max-length", type=int, default=2048,
+                        help="Truncate each book to this many tokens, or the sequence length with --pack (default: 2048)")
+    parser.add_argument("--pack", action="store_true",
+                        help="Keep whole books: cut into --max-length windows and pack short tails with EOS separators")
+    parser.add_argument("--overlap", type=int, default=0, help="Tokens shared by consecutive windows with --pack (default: 0)")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = "Gutenberg-Books-Tokenized" + (".jsonl" if args.format == "jsonl" else "")
+
+    # Sorted so the output order does not depend on the filesystem or on worker timing
+    book_files = sorted(
+        os.path.join(args.input_dir, name) for name in os.listdir(args.input_dir) if name.endswith(".txt")
+    )
+    batches = iter_batches(book_files, max(1, args.batch_size))
+    work = partial(tokenize_batch, max_length=args.max_length, pack=args.pack)
+    packer = SequencePacker(args.max_length, args.overlap) if args.pack else None
+    print(f"🔹 Tokenizing {len(book_files)} books with {args.workers} worker(s), batch size {args.batch_size}...")
+
+    # One process per core already saturates the CPU; keep each tokenizer single-threaded
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    docs = total_tokens = 0
+    start = time.perf_counter()
+    pool = None
+    if args.workers > 1:
+        pool = Pool(args.workers, initializer=init_worker)
+        # imap streams batches to the workers and yields results in input order
+        results = pool.imap(work, batches)
+    else:
+        init_worker()
+        results = map(work, batches)
+
+    if args.format == "shards":
+        # The vocabulary size picks uint16 vs uint32 token storage
+        writer = ShardWriter(args.output, len(_tokenizer or load_tokenizer()), tokenizer_name=TOKENIZER_NAME,
+                             max_shard_bytes=args.shard_size_mb * 1024 * 1024)
+    else:
+        writer = JsonlWriter(args.output)
+
+    # ✅ Convert Books to the output format
+    try:
+        for batch_tokens in results:
+            for tokens in batch_tokens:
+                docs += 1
+                total_tokens += len(tokens)
+                for seq in (packer.add(tokens) if packer else (tokens,)):
+                    writer.add(seq)
+        for seq in (packer.flush() if packer else ()):
+            writer.add(seq)
+    except BaseException:
+        # Don't wait for the batches still queued after an error or Ctrl-C
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        writer.close()
+        if pool:
+            pool.close()
+            pool.join()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"⚡ {docs} books, {total_tokens} tokens in {elapsed:.1f}s "
+          f"({total_tokens / elapsed:,.0f} tokens/s, {docs / elapsed:.2f} books/s)")
+    if packer:
+        print(f"📦 Packed into {packer.sequences} sequences of {args.max_length}: "
+              f"{packer.real_tokens} real tokens, packing efficiency {packer.efficiency:.1%}")
+    print(f"\n🎉 Tokenized books saved to `{args.output}`!")
+
+
+if __name__ == "__main__":
+    main()
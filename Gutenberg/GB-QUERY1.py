@@ -1,37 +1,209 @@
+import argparse
+import csv
+import gzip
+import io
 import json
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 from urllib.request import urlopen
 
-# Topics to search for on Project Gutenberg (via Gutendex API)
+# Topics to search for on Project Gutenberg
 topics = ["cliffsnotes", "summary"]
 
-# Collect unique Gutenberg book IDs across topics
-book_ids = set()
+# Offline catalog dump published by Project Gutenberg (one row per book)
+CATALOG_URL = "https://www.gutenberg.org/cache/epub/feeds/pg_catalog.csv.gz"
+CATALOG_INDEX = "gutenberg_catalog.sqlite"
+GUTENDEX_URL = "https://gutendex.com/books"
+GUTENDEX_PAGE_SIZE = 32
+OUTPUT_FILE = "Gutenberg-Book-Ids.txt"
 
-for topic in topics:
-    print(f"🔍 Searching for books on: {topic}")
-    # Query Gutendex API for the topic
-    params = urlencode({"search": topic})
-    url = f"https://gutendex.com/books?{params}"
+
+def open_catalog(source):
+    """Open the catalog CSV (local path or URL, optionally .gz) as a text stream."""
+    raw = urlopen(source) if source.startswith(("http://", "https://")) else open(source, "rb")
+    if source.endswith(".gz"):
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+def build_catalog_index(source, index_path):
+    """Load the catalog into SQLite with an FTS5 index over titles, subjects, bookshelves and languages."""
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript("""
+        CREATE TABLE books (
+            id INTEGER PRIMARY KEY, type TEXT, issued TEXT, title TEXT, languages TEXT,
+            authors TEXT, subjects TEXT, bookshelves TEXT);
+        CREATE VIRTUAL TABLE books_fts USING fts5(
+            title, subjects, bookshelves, languages, authors,
+            content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+    """)
+    with open_catalog(source) as f:
+        rows = (
+            (int(r["Text#"]), r.get("Type", ""), r.get("Issued", ""), r.get("Title", ""), r.get("Language", ""),
+             r.get("Authors", ""), r.get("Subjects", ""), r.get("Bookshelves", ""))
+            for r in csv.DictReader(f) if (r.get("Text#") or "").isdigit()
+        )
+        db.executemany("INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    db.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    count = db.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+    db.commit()
+    db.close()
+    os.replace(tmp_path, index_path)
+    return count
+
+
+def phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search_catalog(db, queries, language=None, subject=None, book_type="Text"):
+    """Return ids of books matching any query (FTS5 syntax: AND/OR/NOT, column:term, "phrases").
+
+    language, subject and book_type narrow every query.
+    """
+    filters = []
+    if language:
+        filters.append(f"languages : {phrase(language)}")
+    if subject:
+        filters.append(f"subjects : {phrase(subject)}")
+    sql = "SELECT b.id FROM books_fts JOIN books b ON b.id = books_fts.rowid WHERE books_fts MATCH ?"
+    params = []
+    if book_type:
+        sql += " AND b.type = ?"
+        params.append(book_type)
+    ids = set()
+    for query in queries:
+        expr = " AND ".join([f"({query})"] + filters)
+        ids.update(row[0] for row in db.execute(sql, [expr] + params))
+    return ids
+
+
+def topic_query(topic):
+    # Same intent as the old Gutendex guard: the topic appears in the title or a subject
+    return "{title subjects bookshelves} : " + phrase(topic)
+
+
+def fetch_json(url):
+    with urlopen(url) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def fetch_page(url):
+    """fetch_json that returns the error instead of raising, so one bad page doesn't sink the rest."""
     try:
-        with urlopen(url) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-            results = data.get("results", [])
-            for item in results:
-                # Each item should have an 'id' (Gutenberg book id) and 'title'
-                bid = item.get("id")
-                title = (item.get("title") or "").lower()
-                if bid is not None:
-                    # Extra guard: ensure the topic is in the title (case-insensitive)
-                    if topic.lower() in title or topic.lower() in (item.get("subjects") or []):
-                        book_ids.add(int(bid))
+        return fetch_json(url), None
     except Exception as e:
-        print(f"⚠️ Failed to query Gutendex for '{topic}': {e}")
+        return None, e
+
+
+def search_gutendex(topic, workers, language=None, subject=None, book_type="Text"):
+    """Fetch every Gutendex result page for topic, pages after the first concurrently.
+
+    language and subject map to Gutendex's languages= and topic= filters; book_type
+    is checked against each result's media_type. Returns (ids, failed page count).
+    """
+    params = {"search": topic}
+    if language:
+        params["languages"] = language
+    if subject:
+        params["topic"] = subject
+
+    def page_url(page):
+        return f"{GUTENDEX_URL}?{urlencode(dict(params, page=page))}"
+
+    # Without the first page there is no page count, so its failure fails the topic
+    first = fetch_json(page_url(1))
+    results = list(first.get("results", []))
+    pages = math.ceil(first.get("count", 0) / GUTENDEX_PAGE_SIZE)
+    failed = 0
+    if pages > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for page, (data, error) in enumerate(pool.map(fetch_page, (page_url(p) for p in range(2, pages + 1))), 2):
+                if error:
+                    failed += 1
+                    print(f"⚠️ Gutendex page {page}/{pages} for '{topic}' failed: {error}")
+                    continue
+                results.extend(data.get("results", []))
+
+    ids = set()
+    topic_l = topic.lower()
+    for item in results:
+        # Gutendex also matches authors; keep books with the topic in the title or a subject
+        bid = item.get("id")
+        title = (item.get("title") or "").lower()
+        subjects = [s.lower() for s in item.get("subjects") or []]
+        if book_type and item.get("media_type") != book_type:
+            continue
+        if bid is not None and (topic_l in title or any(topic_l in s for s in subjects)):
+            ids.add(int(bid))
+    return ids, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find Project Gutenberg book ids by topic and write Gutenberg-Book-Ids.txt")
+    parser.add_argument("--topic", dest="topics", action="append",
+                        help=f"Topic to match in titles, subjects or bookshelves (repeatable, default: {topics})")
+    parser.add_argument("--query", dest="queries", action="append",
+                        help='Raw FTS5 query, e.g. \'title:summary AND subjects:"english literature" NOT title:poems\'')
+    parser.add_argument("--language", help="Only books in this language code, e.g. en")
+    parser.add_argument("--subject", help="Only books with this subject phrase")
+    parser.add_argument("--type", dest="book_type", default="Text", help="Catalog type to keep; empty for all (default: Text)")
+    parser.add_argument("--catalog", default=CATALOG_URL, help="Catalog CSV path or URL (.csv or .csv.gz)")
+    parser.add_argument("--index", default=CATALOG_INDEX, help=f"Local catalog index (default: {CATALOG_INDEX})")
+    parser.add_argument("--rebuild-index", action="store_true", help="Re-ingest the catalog even if the index exists")
+    parser.add_argument("--online", action="store_true",
+                        help="Query Gutendex instead of the local index, following every page (--query is not supported)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent Gutendex page requests with --online (default: 8)")
+    parser.add_argument("--output", default=OUTPUT_FILE, help=f"Where to write the ids (default: {OUTPUT_FILE})")
+    args = parser.parse_args()
+    if args.online and args.queries:
+        parser.error("--query uses the local index's FTS5 syntax and cannot be combined with --online")
+
+    search_topics = args.topics or ([] if args.queries else topics)
+    book_ids = set()
+    start = time.perf_counter()
+
+    if args.online:
+        for topic in search_topics:
+            print(f"🔍 Searching Gutendex for books on: {topic}")
+            try:
+                ids, failed = search_gutendex(topic, args.workers, language=args.language, subject=args.subject,
+                                              book_type=args.book_type)
+            except Exception as e:
+                print(f"⚠️ Failed to query Gutendex for '{topic}': {e}")
+                continue
+            book_ids |= ids
+            if failed:
+                print(f"⚠️ Partial results for '{topic}': {len(ids)} books, {failed} pages failed")
+    else:
+        if args.rebuild_index or not os.path.exists(args.index):
+            print(f"📥 Indexing Project Gutenberg catalog from {args.catalog} ...")
+            count = build_catalog_index(args.catalog, args.index)
+            print(f"✅ Indexed {count} catalog entries into {args.index}")
+        queries = [topic_query(t) for t in search_topics] + (args.queries or [])
+        with sqlite3.connect(args.index) as db:
+            try:
+                book_ids = search_catalog(db, queries, language=args.language, subject=args.subject,
+                                          book_type=args.book_type)
+            except sqlite3.OperationalError as e:
+                # e.g. "fts5: syntax error near ..." for a malformed --query
+                parser.error(f"invalid search query: {e}")
+
+    print(f"\n📚 Found {len(book_ids)} books matching our topics in {(time.perf_counter() - start) * 1000:.0f} ms!")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for book_id in sorted(book_ids):
+            f.write(str(book_id) + "\n")
 
-print(f"\n📚 Found {len(book_ids)} books matching our topics!")
+    print(f"✅ Book IDs saved to `{args.output}`.")
 
-with open("Gutenberg-Book-Ids.txt", "w", encoding="utf-8") as f:
-    for book_id in sorted(book_ids):
-        f.write(str(book_id) + "\n")
 
-print("✅ Book IDs saved to `Gutenberg-Book-Ids.txt`.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compact, memory-mappable token shards for tokenized Gutenberg books.
+
+A shard directory holds, per shard N:
+  shard-0000N.bin   all samples' token ids back to back, little-endian uint16 or uint32
+  shard-0000N.idx   num_samples + 1 little-endian uint64 token offsets into the .bin
+  shard-0000N.json  metadata: dtype, counts, vocab size, tokenizer name
+plus index.json listing every shard's metadata. Labels are not stored: they are
+the input_ids, as in the JSONL format.
+
+Reading a sample needs no parsing:
+  from token_shards import open_shards
+  shards = open_shards("Gutenberg-Books-Tokenized")
+  tokens = shards[0][17]        # numpy view of sample 17, backed by np.memmap
+"""
+
+import json
+import os
+import re
+import sys
+from array import array
+
+FORMAT_NAME = "gutenberg-token-shard"
+FORMAT_VERSION = 1
+# array typecodes with a guaranteed item size for each dtype
+_TYPECODES = {"uint16": "H", "uint32": "I", "uint64": "Q"}
+_SHARD_FILE_RE = re.compile(r"shard-\d+\.(bin|idx|json)(\.part)?$")
+
+
+def dtype_for_vocab(vocab_size):
+    """Smallest unsigned dtype that can hold every token id of the vocabulary."""
+    return "uint16" if vocab_size <= 1 << 16 else "uint32"
+
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def clear_shards(out_dir):
+    """Remove the shards and index.json of an earlier run, so none are left beside the new ones."""
+    for name in os.listdir(out_dir):
+        if name == "index.json" or _SHARD_FILE_RE.match(name):
+            os.remove(os.path.join(out_dir, name))
+
+
+class ShardWriter:
+    """Append token sequences to size-bounded shards in out_dir, replacing any shards already there."""
+
+    def __init__(self, out_dir, vocab_size, tokenizer_name="", max_shard_bytes=512 * 1024 * 1024):
+        self.out_dir = out_dir
+        self.vocab_size = vocab_size
+        self.tokenizer_name = tokenizer_name
+        self.dtype = dtype_for_vocab(vocab_size)
+        self.typecode = _TYPECODES[self.dtype]
+        self.itemsize = array(self.typecode).itemsize
+        self.max_shard_tokens = max(1, max_shard_bytes // self.itemsize)
+        self.shards = []
+        self._bin = None
+        os.makedirs(out_dir, exist_ok=True)
+        clear_shards(out_dir)
+
+    def _open_shard(self):
+        self._name = f"shard-{len(self.shards):05d}"
+        self._bin = open(os.path.join(self.out_dir, self._name + ".bin.part"), "wb")
+        self._offsets = array("Q", [0])
+        self._tokens = 0
+
+    def add(self, tokens):
+        if self._bin is None:
+            self._open_shard()
+        data = array(self.typecode, tokens)
+        if data and max(data) >= self.vocab_size:
+            raise ValueError(f"token id {max(data)} is outside the vocabulary ({self.vocab_size})")
+        _little_endian(data).tofile(self._bin)
+        self._tokens += len(data)
+        self._offsets.append(self._tokens)
+        if self._tokens >= self.max_shard_tokens:
+            self._close_shard()
+
+    def _close_shard(self):
+        self._bin.close()
+        self._bin = None
+        base = os.path.join(self.out_dir, self._name)
+        with open(base + ".idx.part", "wb") as f:
+            _little_endian(self._offsets).tofile(f)
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "dtype": self.dtype,
+            "byteorder": "little",
+            "num_samples": len(self._offsets) - 1,
+            "num_tokens": self._tokens,
+            "vocab_size": self.vocab_size,
+            "tokenizer": self.tokenizer_name,
+            "labels": "input_ids",
+            "bin": self._name + ".bin",
+            "idx": self._name + ".idx",
+        }
+        # Rename only complete shards into place
+        os.replace(base + ".bin.part", base + ".bin")
+        os.replace(base + ".idx.part", base + ".idx")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        self.shards.append(meta)
+
+    def close(self):
+        if self._bin is not None:
+            if len(self._offsets) > 1:
+                self._close_shard()
+            else:
+                self._bin.close()
+                os.remove(os.path.join(self.out_dir, self._name + ".bin.part"))
+                self._bin = None
+        with open(os.path.join(self.out_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": FORMAT_NAME,
+                "version": FORMAT_VERSION,
+                "num_samples": sum(m["num_samples"] for m in self.shards),
+                "num_tokens": sum(m["num_tokens"] for m in self.shards),
+                "shards": [m["bin"][:-len(".bin")] + ".json" for m in self.shards],
+            }, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenShard:
+    """Read-only, zero-copy view of one shard; shard[i] is sample i as a numpy array."""
+
+    def __init__(self, meta_path):
+        import numpy as np
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        base_dir = os.path.dirname(meta_path)
+        dtype = np.dtype(self.meta["dtype"]).newbyteorder("<")
+        if self.meta["num_tokens"]:
+            self.tokens = np.memmap(os.path.join(base_dir, self.meta["bin"]), dtype=dtype, mode="r")
+        else:
+            # Only empty samples: the .bin is 0 bytes, which np.memmap cannot map
+            self.tokens = np.empty(0, dtype=dtype)
+        self.offsets = np.memmap(os.path.join(base_dir, self.meta["idx"]), dtype="<u8", mode="r")
+
+    def __len__(self):
+        return self.meta["num_samples"]
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+
+def open_shards(shard_dir):
+    with open(os.path.join(shard_dir, "index.json"), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    return [TokenShard(os.path.join(shard_dir, name)) for name in index["shards"]]
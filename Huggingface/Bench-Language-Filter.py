@@ -0,0 +1,142 @@
+"""
+Compare the language filter paths of Filter-HF-Datasets.py on a Stack-like Parquet corpus.
+
+  per-example  the previous filter: one Python call per row, ds.filter(fn)
+  batched      language_mask() over Arrow batches of just the language column
+  batched-N    the same with num_proc=N processes
+  pushdown     filter_parquet_file(): read the language column of each row group first,
+               load content only for row groups with matches (the --streaming path)
+
+The datasets paths filter a prepared Arrow cache, as in the non-streaming run; building
+that cache is not timed. pushdown reads and decodes the Parquet files themselves.
+
+Examples:
+  # Benchmark a local copy of some of The Stack's files (data/<language>/*.parquet)
+  python Bench-Language-Filter.py --parquet-dir /data/the-stack --languages Python Go
+
+  # No data at hand: synthesize 300k rows over 60 languages, one directory per language
+  python Bench-Language-Filter.py --rows 300000
+"""
+
+import argparse
+import glob
+import importlib.util
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import datasets
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+OTHER_LANGUAGES = [
+    "C", "C++", "C#", "Java", "Kotlin", "Scala", "Rust", "Ruby", "Perl", "Lua", "R", "Julia", "Haskell",
+    "OCaml", "Erlang", "Elixir", "Clojure", "Dart", "Swift", "Objective-C", "Fortran", "COBOL", "Assembly",
+    "Pascal", "Ada", "Groovy", "PowerShell", "Batchfile", "TeX", "SQL", "Solidity", "Verilog", "VHDL",
+    "Prolog", "Scheme", "Racket", "F#", "Visual Basic", "MATLAB",
+]
+
+
+def load_filter_module():
+    spec = importlib.util.spec_from_file_location("filter_hf_datasets", os.path.join(HERE, "Filter-HF-Datasets.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def write_synthetic_corpus(root, rows, content_bytes, languages, mixed, row_group_rows):
+    """One directory per language like The Stack, or every language shuffled together with mixed."""
+    rng = random.Random(0)
+    # Random text so the content column compresses like source code rather than to nothing
+    filler = "".join(rng.choices("abcdefghij klmnopqrstuvwxyz(){};=\n", k=max(4 << 20, content_bytes * 2)))
+    langs = [rng.choice(languages) for _ in range(rows)]
+    if not mixed:
+        langs.sort()
+    per_file = max(row_group_rows * 4, 1)
+    for n, i in enumerate(range(0, rows, per_file)):
+        chunk = langs[i:i + per_file]
+        subdir = os.path.join(root, "data", "mixed" if mixed else chunk[0].lower().replace("+", "p").replace("#", "sharp"))
+        os.makedirs(subdir, exist_ok=True)
+        table = pa.table({
+            "content": [filler[o:o + content_bytes]
+                        for o in (rng.randrange(len(filler) - content_bytes) for _ in chunk)],
+            "language": chunk,
+            "size": [content_bytes] * len(chunk),
+        })
+        pq.write_table(table, os.path.join(subdir, f"train-{n:05d}.parquet"), row_group_size=row_group_rows)
+
+
+def best_of(repeat, fn):
+    times, result = [], None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the Filter-HF-Datasets language filter paths.")
+    p.add_argument("--parquet-dir", help="Directory of Parquet files with a 'language' column (default: synthesize)")
+    p.add_argument("--languages", nargs="+", help="Languages to keep (default: Filter-HF-Datasets DEFAULT_LANGUAGES)")
+    p.add_argument("--rows", type=int, default=300000, help="Rows in the synthetic corpus (default: 300000)")
+    p.add_argument("--content-bytes", type=int, default=1000, help="Content size per synthetic row (default: 1000)")
+    p.add_argument("--row-group-rows", type=int, default=5000, help="Rows per synthetic row group (default: 5000)")
+    p.add_argument("--mixed", action="store_true", help="Shuffle languages across all files instead of per-language files")
+    p.add_argument("--num-proc", type=int, default=os.cpu_count() or 1, help="Processes/threads for the parallel paths")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per path; the best time is reported (default: 3)")
+    args = p.parse_args()
+
+    fhd = load_filter_module()
+    languages = args.languages or fhd.DEFAULT_LANGUAGES
+    work = tempfile.mkdtemp(prefix="bench-language-filter-")
+    datasets.disable_caching()
+    datasets.disable_progress_bars()
+    try:
+        root = args.parquet_dir
+        if not root:
+            root = os.path.join(work, "corpus")
+            print(f"Synthesizing {args.rows} rows ({'mixed' if args.mixed else 'per-language'} files) -> {root}")
+            write_synthetic_corpus(root, args.rows, args.content_bytes, fhd.DEFAULT_LANGUAGES + OTHER_LANGUAGES,
+                                   args.mixed, args.row_group_rows)
+        files = sorted(glob.glob(os.path.join(root, "**", "*.parquet"), recursive=True))
+        size = sum(os.path.getsize(f) for f in files)
+        print(f"Corpus: {len(files)} Parquet files, {size / 1e6:.1f} MB; keeping {len(languages)} languages")
+
+        ds = datasets.load_dataset("parquet", data_files=files, split="train", cache_dir=os.path.join(work, "cache"))
+        keep = set(languages)
+        mask = fhd.language_mask(languages)
+
+        def per_example():
+            return len(ds.filter(lambda ex: ex.get("language") in set(languages)))
+
+        def batched(num_proc):
+            return lambda: len(ds.with_format("arrow").filter(
+                mask, batched=True, batch_size=10000, input_columns="language",
+                num_proc=num_proc if num_proc > 1 else None))
+
+        def pushdown():
+            return sum(len(t) for tables, _, _ in fhd.iter_pushdown(files, None, languages, args.num_proc)
+                       for t in tables)
+
+        paths = [("per-example", per_example), ("batched", batched(1))]
+        if args.num_proc > 1:
+            paths.append((f"batched-{args.num_proc}", batched(args.num_proc)))
+        paths.append(("pushdown", pushdown))
+
+        print(f"{'path':14} {'rows kept':>10} {'best s':>8} {'rows/s':>14} {'speedup':>8}")
+        baseline = None
+        for name, fn in paths:
+            elapsed, kept = best_of(1 if name == "per-example" else args.repeat, fn)
+            baseline = baseline or elapsed
+            print(f"{name:14} {kept:>10} {elapsed:>8.3f} {len(ds) / elapsed:>14,.0f} {baseline / elapsed:>7.1f}x")
+        assert kept == sum(1 for lang in ds.with_format("arrow")["language"].to_pylist() if lang in keep)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,17 @@
 import argparse
+import glob
 import os
-from datasets import load_dataset, concatenate_datasets
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datasets import load_dataset
+
+from dedup import Deduplicator
+from sharded_output import PartitionedWriter, ShardedWriter, unify
 
 # Default frontend & API-related languages to include
 DEFAULT_LANGUAGES = [
@@ -19,7 +30,7 @@ DEFAULT_REPOS = [
 
 
 def parse_args():
-    parser = argparse.ArgumentParser(description="Filter multiple Hugging Face datasets by language and save as .parquet and .jsonl")
+    parser = argparse.ArgumentParser(description="Filter multiple Hugging Face datasets by language and save as sharded .parquet and .jsonl")
     parser.add_argument(
         "--repos",
         nargs="+",
@@ -50,7 +61,7 @@ def parse_args():
     parser.add_argument(
         "--output_name",
         default="filtered_combined",
-        help="Base filename (without extension) for outputs",
+        help="Name of the output folder inside output_dir holding the shards and manifest.json",
     )
     parser.add_argument(
         "--no_parquet",
@@ -62,9 +73,288 @@ def parse_args():
         action="store_true",
         help="Skip writing .jsonl output",
     )
+    parser.add_argument(
+        "--shard_size_mb",
+        type=int,
+        default=512,
+        help="Target uncompressed size of each output shard (default: 512)",
+    )
+    parser.add_argument(
+        "--row_group_size",
+        type=int,
+        default=10000,
+        help="Rows per Parquet row group (default: 10000)",
+    )
+    parser.add_argument(
+        "--parquet_compression",
+        choices=("zstd", "snappy", "gzip", "none"),
+        default="zstd",
+        help="Parquet compression codec (default: zstd)",
+    )
+    parser.add_argument(
+        "--jsonl_compression",
+        choices=("zstd", "gzip", "none"),
+        default="zstd",
+        help="JSONL compression, written as .jsonl.zst / .jsonl.gz (default: zstd)",
+    )
+    parser.add_argument(
+        "--compression_level",
+        type=int,
+        default=None,
+        help="Codec level for both outputs (default: codec default)",
+    )
+    parser.add_argument(
+        "--write_workers",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Shard write threads; Parquet shards are encoded in parallel, JSONL encoding is "
+             "GIL-bound and only overlaps with reading (default: min(4, cores))",
+    )
+    parser.add_argument(
+        "--partition_by",
+        default=None,
+        help="Write Hive-style <column>=<value>/ directories, e.g. --partition_by language, "
+             "each with its own shards and counts in manifest.json",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Stream rows from the source shards instead of downloading whole datasets into cache_dir; "
+             "kept rows are written as they arrive",
+    )
+    parser.add_argument(
+        "--batch_rows",
+        type=int,
+        default=10000,
+        help="Rows per Arrow batch read from datasets (default: 10000)",
+    )
+    parser.add_argument(
+        "--num_proc",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes for the language filter (threads for Parquet reads with --streaming) (default: all cores)",
+    )
+    parser.add_argument(
+        "--filter_batch_size",
+        type=int,
+        default=10000,
+        help="Rows per vectorized language-filter batch (default: 10000)",
+    )
+    parser.add_argument(
+        "--no_pushdown",
+        action="store_true",
+        help="With --streaming, do not read Parquet sources directly (language column first); "
+             "always go through datasets streaming",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=("none", "exact", "near"),
+        default="none",
+        help="Drop repeated rows across all repos: exact (normalized content hash) "
+             "or near (exact plus MinHash/LSH) (default: none)",
+    )
+    parser.add_argument(
+        "--near_dup_threshold",
+        type=float,
+        default=0.85,
+        help="Approximate Jaccard similarity above which rows count as near duplicates (default: 0.85)",
+    )
+    parser.add_argument(
+        "--minhash_perm",
+        type=int,
+        default=128,
+        help="MinHash permutations per row (default: 128)",
+    )
+    parser.add_argument(
+        "--shingle_size",
+        type=int,
+        default=5,
+        help="Words per MinHash shingle (default: 5)",
+    )
+    parser.add_argument(
+        "--dedup_column",
+        default="content",
+        help="Column compared for duplicates (default: content)",
+    )
     return parser.parse_args()
 
 
+def language_mask(languages):
+    """Batched filter: one vectorized membership test over an Arrow 'language' column.
+
+    Missing (null) languages are not selected.
+    """
+    value_set = pa.array(sorted(set(languages)), type=pa.string())
+
+    def mask(language_column):
+        return pc.is_in(language_column, value_set=value_set)
+
+    return mask
+
+
+def parquet_files(repo, split):
+    """Parquet data files of split in a local directory or Hub dataset repo, and the filesystem to open them.
+
+    Files belong to a split when their name starts with it or a directory is
+    named after it; like the Hub, files that name no split count as train.
+    """
+    if os.path.isdir(repo):
+        fs = None
+        paths = glob.glob(os.path.join(repo, "**", "*.parquet"), recursive=True)
+    else:
+        from huggingface_hub import HfFileSystem
+        fs = HfFileSystem()
+        paths = fs.glob(f"datasets/{repo}/**/*.parquet")
+    paths = sorted(p.replace(os.sep, "/") for p in paths)
+
+    def names_split(path, name):
+        parts = path.split("/")
+        return parts[-1].startswith(name) or name in parts[:-1]
+
+    selected = [p for p in paths if names_split(p, split)]
+    if not selected and split == "train":
+        selected = [p for p in paths if not any(names_split(p, s) for s in ("validation", "valid", "test"))]
+    return selected, fs
+
+
+def filter_parquet_file(path, fs, languages):
+    """Read only the 'language' column first and load the other columns just for row groups that match.
+
+    Row groups whose min/max statistics exclude every language are skipped
+    without reading any data. Returns (kept tables, rows scanned, row groups skipped).
+    """
+    mask = language_mask(languages)
+    tables, scanned, skipped = [], 0, 0
+    with (fs.open(path, "rb") if fs else open(path, "rb")) as f:
+        pf = pq.ParquetFile(f)
+        leaves = [pf.schema.column(i).path for i in range(len(pf.schema))]
+        if "language" not in leaves:
+            raise ValueError(f"{path} has no 'language' column")
+        leaf = leaves.index("language")
+        for rg in range(pf.num_row_groups):
+            stats = pf.metadata.row_group(rg).column(leaf).statistics
+            if stats is not None and stats.has_min_max and isinstance(stats.min, str) \
+                    and not any(stats.min <= lang <= stats.max for lang in languages):
+                skipped += 1
+                continue
+            selected = mask(pf.read_row_group(rg, columns=["language"]).column(0))
+            scanned += len(selected)
+            kept = pc.sum(selected).as_py() or 0
+            if kept == len(selected):
+                tables.append(pf.read_row_group(rg))
+            elif kept:
+                tables.append(pf.read_row_group(rg).filter(selected))
+    return tables, scanned, skipped
+
+
+def iter_pushdown(files, fs, languages, workers):
+    """filter_parquet_file over files on a thread pool, yielding results in file order with bounded lookahead."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in files:
+            pending.append(pool.submit(filter_parquet_file, path, fs, languages))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_streamed(repo, args):
+    """Fallback for non-Parquet sources: stream via datasets, filtering each Arrow batch by its language column."""
+    mask = language_mask(args.languages)
+    ds = load_dataset(repo, cache_dir=args.cache_dir, split=args.split, streaming=True)
+    # input_columns is not honoured for Arrow-formatted iterable datasets, so pick the column here
+    ds = ds.with_format("arrow").filter(lambda table: mask(table["language"]), batched=True,
+                                        batch_size=args.filter_batch_size)
+    for table in ds.iter(batch_size=args.batch_rows):
+        # Rows dropped by the filter are not counted on this path
+        yield [table], 0, 0
+
+
+def stream_filtered(args, output, dedup=None):
+    """Filter every repo lazily and write kept rows incrementally; nothing is materialized in cache_dir."""
+    start = time.perf_counter()
+    total = 0
+    first_written = False
+    for repo in args.repos:
+        try:
+            files, fs = ([], None) if args.no_pushdown else parquet_files(repo, args.split)
+            if files:
+                print(f"🔹 Reading {len(files)} Parquet files of {repo} (split={args.split}), "
+                      f"language column first ...")
+                results = iter_pushdown(files, fs, args.languages, max(1, args.num_proc))
+            else:
+                print(f"🔹 Streaming dataset: {repo} (split={args.split}) ...")
+                results = iter_streamed(repo, args)
+        except Exception as e:
+            print(f"⚠️ Failed to load {repo}: {e}")
+            continue
+
+        kept = written = scanned = skipped = 0
+        results = iter(results)
+        while True:
+            # Only reading the source is allowed to fail per repo; a failed write stops the run
+            # rather than carrying on with a gap in the output
+            try:
+                tables, n_scanned, n_skipped = next(results)
+            except StopIteration:
+                break
+            except Exception as e:
+                print(f"⚠️ Streaming failed for {repo} after {written} rows: {e}")
+                break
+            scanned += n_scanned
+            skipped += n_skipped
+            for table in tables:
+                unique = dedup.filter_table(table, repo) if dedup else table
+                output.add_table(unique)
+                # output.rows counts only rows in shards already on disk
+                if not first_written and output.rows:
+                    first_written = True
+                    print(f"   - First rows written after {time.perf_counter() - start:.1f}s")
+                if (written + len(unique)) // 100000 > written // 100000:
+                    print(f"   - {written + len(unique)} rows written so far "
+                          f"({(total + written) / (time.perf_counter() - start):,.0f} rows/s overall)")
+                kept += len(table)
+                written += len(unique)
+        total += written
+        note = f" of {scanned} scanned" if scanned else ""
+        note += f", {skipped} row groups skipped by statistics" if skipped else ""
+        print(f"   - Kept {kept} rows{note} after filtering"
+              + (f", {written} written after dedup" if dedup else ""))
+
+    if total:
+        print(f"✅ Streamed {total} rows in {time.perf_counter() - start:.1f}s")
+
+
+def report_output(manifest, out_dir):
+    if not manifest["rows"]:
+        print("❌ No rows remained after filtering.")
+        return
+    print(f"💾 Wrote {manifest['rows']} rows in {manifest['shards']} shards "
+          f"({manifest['bytes'] / 1e6:,.1f} MB on disk) → {out_dir}")
+    for part in manifest.get("partitions", []):
+        print(f"   - {part['path']}: {part['rows']} rows, {part['shards']} shards, {part['bytes'] / 1e6:,.1f} MB")
+    print(f"📄 Manifest → {os.path.join(out_dir, 'manifest.json')}")
+
+
+def report_dedup(report):
+    removed = report["exact_duplicates"] + report["near_duplicates"]
+    print(f"🧹 Dedup ({report['mode']}): removed {removed} of {report['rows']} rows "
+          f"({report['exact_duplicates']} exact, {report['near_duplicates']} near)")
+    per_repo = {}
+    for row in report["by_repo_language"]:
+        totals = per_repo.setdefault(row["repo"], [0, 0, 0])
+        totals[0] += row["rows"]
+        totals[1] += row["exact_duplicates"]
+        totals[2] += row["near_duplicates"]
+    for repo, (rows, exact, near) in per_repo.items():
+        print(f"   - {repo}: {exact} exact + {near} near of {rows} rows")
+    for row in report["by_repo_language"]:
+        if row["exact_duplicates"] or row["near_duplicates"]:
+            print(f"     · {row['repo']} / {row['language']}: {row['exact_duplicates']} exact, "
+                  f"{row['near_duplicates']} near of {row['rows']}")
+
+
 def main():
     args = parse_args()
 
@@ -77,11 +367,62 @@ def main():
     print(f"   - Cache dir: {args.cache_dir}")
     print(f"   - Output dir: {args.output_dir}")
 
+    formats = [fmt for fmt, skip in (("parquet", args.no_parquet), ("jsonl", args.no_jsonl)) if not skip]
+    if not formats:
+        print("❌ Both --no_parquet and --no_jsonl given. Nothing to save.")
+        return
+
+    def open_output(schema=None):
+        out_dir = os.path.join(args.output_dir, args.output_name)
+        options = dict(
+            schema=schema,
+            formats=formats,
+            shard_bytes=args.shard_size_mb * 1024 * 1024,
+            row_group_size=args.row_group_size,
+            parquet_compression=args.parquet_compression,
+            jsonl_compression=args.jsonl_compression,
+            compression_level=args.compression_level,
+            workers=args.write_workers,
+        )
+        if args.partition_by:
+            return PartitionedWriter(out_dir, args.partition_by, **options)
+        return ShardedWriter(out_dir, **options)
+
+    dedup = None
+    if args.dedup != "none":
+        dedup = Deduplicator(
+            os.path.join(args.output_dir, f".{args.output_name}-dedup.sqlite"),
+            near=args.dedup == "near",
+            threshold=args.near_dup_threshold,
+            num_perm=args.minhash_perm,
+            shingle_size=args.shingle_size,
+            column=args.dedup_column,
+            workers=args.num_proc,
+        )
+        if dedup.near:
+            print(f"   - Near-dup LSH: {dedup.bands} bands x {dedup.rows_per_band} rows "
+                  f"(threshold ~{args.near_dup_threshold})")
+
+    def finish(output):
+        # The dedup index is closed (and its file removed) even when writing the output fails
+        try:
+            report_output(output.close(), output.out_dir)
+            if dedup:
+                report_dedup(dedup.write_report(os.path.join(output.out_dir, "dedup_report.json")))
+        finally:
+            if dedup:
+                dedup.close()
+
     datasets_list = []
 
-    def language_filter(example):
-        # Use .get to be robust if 'language' is missing; treat missing as not selected
-        return example.get("language") in set(args.languages)
+    if args.streaming:
+        output = open_output()
+        try:
+            stream_filtered(args, output, dedup)
+        finally:
+            finish(output)
+        print("🎉 Done.")
+        return
 
     for repo in args.repos:
         try:
@@ -93,7 +434,14 @@ def main():
 
         print(f"   - Filtering by languages ({len(args.languages)} values)...")
         try:
-            filtered_ds = ds.filter(language_filter)
+            # Arrow batches of just the language column: no per-row Python, content is never decoded
+            filtered_ds = ds.with_format("arrow").filter(
+                language_mask(args.languages),
+                batched=True,
+                batch_size=args.filter_batch_size,
+                input_columns="language",
+                num_proc=args.num_proc if args.num_proc > 1 else None,
+            ).with_format(None)
         except Exception as e:
             print(f"⚠️ Filtering failed for {repo} (possibly missing 'language' field): {e}")
             print("   - Proceeding without filtering for this repo.")
@@ -102,37 +450,35 @@ def main():
         count = len(filtered_ds)
         print(f"   - Kept {count} rows after filtering")
         if count > 0:
-            datasets_list.append(filtered_ds)
+            datasets_list.append((repo, filtered_ds))
         else:
             print("   - Skipping empty filtered result for this repo.")
 
     if not datasets_list:
         print("❌ No datasets were loaded or remained after filtering. Nothing to save.")
+        if dedup:
+            dedup.close()
         return
 
-    if len(datasets_list) == 1:
-        combined = datasets_list[0]
-    else:
-        print(f"🔹 Concatenating {len(datasets_list)} filtered datasets...")
-        combined = concatenate_datasets(datasets_list)
-
-    print(f"✅ Combined dataset size: {len(combined)} rows")
+    print(f"✅ Combined dataset size: {sum(len(ds) for _, ds in datasets_list)} rows"
+          + (" before dedup" if dedup else ""))
 
-    # Save outputs
-    parquet_path = os.path.join(args.output_dir, f"{args.output_name}.parquet")
-    jsonl_path = os.path.join(args.output_dir, f"{args.output_name}.jsonl")
+    # One schema for all repos, so every shard and partition has the same columns and types
+    try:
+        schema = unify([ds.features.arrow_schema for _, ds in datasets_list])
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"⚠️ Repos have conflicting column types ({e}); using the first repo's schema")
+        schema = None
 
-    if not args.no_parquet:
-        print(f"💾 Writing Parquet → {parquet_path}")
-        combined.to_parquet(parquet_path)
-    else:
-        print("⏭️ Skipping Parquet output as requested")
-
-    if not args.no_jsonl:
-        print(f"💾 Writing JSONL → {jsonl_path}")
-        combined.to_json(jsonl_path)
-    else:
-        print("⏭️ Skipping JSONL output as requested")
+    # Save outputs, repo by repo so dedup can attribute removals
+    output = open_output(schema)
+    print(f"💾 Writing {' + '.join(formats)} shards → {output.out_dir}")
+    try:
+        for repo, ds in datasets_list:
+            for table in ds.with_format("arrow").iter(batch_size=args.batch_rows):
+                output.add_table(dedup.filter_table(table, repo) if dedup else table)
+    finally:
+        finish(output)
 
     print("🎉 Done.")
 
@@ -0,0 +1,187 @@
+"""
+Exact and near-duplicate removal for Filter-HF-Datasets.py.
+
+Rows are checked in the order they are written, and the first copy wins:
+  exact  blake2b of the content with all whitespace runs collapsed
+  near   MinHash over hashed word n-grams, banded for LSH; a row whose band
+         collides with an earlier row's band is dropped as a near duplicate
+
+Signatures are computed in a process pool. Seen keys and bands live in an
+on-disk SQLite index with a fixed page cache, so memory stays flat however
+many rows pass through.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+import pyarrow as pa
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+SHINGLE_CHUNK = 8192
+TOKEN_RE = re.compile(r"\w+")
+
+
+def lsh_params(num_perm, threshold):
+    """Bands x rows (bands * rows == num_perm) whose S-curve midpoint (1/b)^(1/r) is closest to threshold."""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+def _permutations(num_perm, seed=1):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def exact_key(text):
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=16).digest()
+
+
+def minhash(text, a, b, shingle_size):
+    """MinHash signature over word shingle_size-grams, or None for text without words."""
+    tokens = TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    k = min(shingle_size, len(hashes))
+    shingles = hashes[:len(hashes) - k + 1].copy()
+    with np.errstate(over="ignore"):
+        for j in range(1, k):
+            shingles = (shingles * np.uint64(0x100000001B3)) ^ hashes[j:len(hashes) - k + 1 + j]
+        shingles &= MAX_HASH
+        signature = np.full(len(a), MAX_HASH, dtype=np.uint64)
+        # Chunked so a huge file never needs a (shingles x num_perm) matrix at once
+        for i in range(0, len(shingles), SHINGLE_CHUNK):
+            chunk = shingles[i:i + SHINGLE_CHUNK, None]
+            perm = ((chunk * a + b) % MERSENNE_PRIME) & MAX_HASH
+            np.minimum(signature, perm.min(axis=0), out=signature)
+    return signature
+
+
+def signatures(texts, num_perm, bands, shingle_size):
+    """(exact key, [band keys]) per text; band keys are empty when near-dup detection is off."""
+    a, b = _permutations(num_perm) if bands else (None, None)
+    rows = num_perm // bands if bands else 0
+    out = []
+    for text in texts:
+        text = text or ""
+        band_keys = []
+        if bands:
+            sig = minhash(text, a, b, shingle_size)
+            if sig is not None:
+                band_keys = [bytes([i]) + hashlib.blake2b(sig[i * rows:(i + 1) * rows].tobytes(), digest_size=8).digest()
+                             for i in range(bands)]
+        out.append((exact_key(text), band_keys))
+    return out
+
+
+class Deduplicator:
+    """Drop rows already seen, exactly or (with near=True) by MinHash/LSH, and count removals per repo and language."""
+
+    def __init__(self, index_path, near=True, threshold=0.85, num_perm=128, shingle_size=5, column="content",
+                 language_column="language", workers=1, cache_mb=256):
+        self.index_path = index_path
+        self.near = near
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows_per_band = lsh_params(num_perm, threshold) if near else (0, 0)
+        if self.bands > 255:
+            raise ValueError(f"num_perm {num_perm} gives {self.bands} bands; at most 255 are supported")
+        self.column = column
+        self.language_column = language_column
+        self.workers = max(1, workers)
+        self.stats = defaultdict(lambda: {"rows": 0, "exact_duplicates": 0, "near_duplicates": 0, "unchecked": 0})
+        self._work = partial(signatures, num_perm=num_perm, bands=self.bands, shingle_size=shingle_size)
+        # Started before any writer threads exist, so the workers fork from a single-threaded process
+        self._pool = Pool(self.workers) if self.workers > 1 else None
+
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self._db = sqlite3.connect(index_path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+        self._db.executescript("""
+            CREATE TABLE exact (key BLOB PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE bands (key BLOB PRIMARY KEY) WITHOUT ROWID;
+        """)
+
+    def filter_table(self, table, repo):
+        """Return the rows of table not seen before; every row is added to the index."""
+        if not len(table):
+            return table
+        languages = (table.column(self.language_column).to_pylist()
+                     if self.language_column in table.column_names else [None] * len(table))
+        if self.column not in table.column_names:
+            for lang in languages:
+                self.stats[(repo, lang)]["rows"] += 1
+                self.stats[(repo, lang)]["unchecked"] += 1
+            return table
+
+        texts = table.column(self.column).to_pylist()
+        if self._pool:
+            step = -(-len(texts) // self.workers)
+            parts = self._pool.map(self._work, [texts[i:i + step] for i in range(0, len(texts), step)])
+            sigs = [sig for part in parts for sig in part]
+        else:
+            sigs = self._work(texts)
+
+        keep = []
+        with self._db:
+            cur = self._db.cursor()
+            for lang, (key, band_keys) in zip(languages, sigs):
+                counts = self.stats[(repo, lang)]
+                counts["rows"] += 1
+                cur.execute("INSERT OR IGNORE INTO exact VALUES (?)", (key,))
+                if not cur.rowcount:
+                    counts["exact_duplicates"] += 1
+                    keep.append(False)
+                    continue
+                seen = False
+                for band_key in band_keys:
+                    cur.execute("INSERT OR IGNORE INTO bands VALUES (?)", (band_key,))
+                    seen = seen or not cur.rowcount
+                if seen:
+                    counts["near_duplicates"] += 1
+                keep.append(not seen)
+        return table if all(keep) else table.filter(pa.array(keep))
+
+    def report(self):
+        rows = [{"repo": repo, "language": lang, **counts} for (repo, lang), counts in sorted(
+            self.stats.items(), key=lambda kv: (kv[0][0], str(kv[0][1])))]
+        return {
+            "mode": "near" if self.near else "exact",
+            "threshold": self.threshold if self.near else None,
+            "num_perm": self.num_perm if self.near else None,
+            "bands": self.bands or None,
+            "rows_per_band": self.rows_per_band or None,
+            "rows": sum(r["rows"] for r in rows),
+            "exact_duplicates": sum(r["exact_duplicates"] for r in rows),
+            "near_duplicates": sum(r["near_duplicates"] for r in rows),
+            "by_repo_language": rows,
+        }
+
+    def write_report(self, path):
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+        self._db.close()
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            if os.path.exists(self.index_path + suffix):
+                os.remove(self.index_path + suffix)
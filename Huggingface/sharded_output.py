@@ -0,0 +1,345 @@
+"""
+Size-bounded, compressed output shards for Filter-HF-Datasets.py.
+
+An output directory holds one subtree per format, with per shard N:
+  parquet/part-0000N.parquet    zstd-compressed Parquet with a fixed row-group size
+  jsonl/part-0000N.jsonl.zst    the same rows as zstd-compressed JSON lines
+plus manifest.json listing every file with its format, row count, size and
+sha256. Shards are written on a thread pool while the next one is being
+filled, and only complete files are renamed into place. Parquet encoding and
+compression run in pyarrow without the GIL, so Parquet shards are written in
+parallel; JSON lines are encoded with json.dumps under the GIL, so JSONL shards
+mostly just overlap with reading and filtering.
+
+With PartitionedWriter the shards go into Hive-style directories instead,
+e.g. parquet/language=Go/part-00000.parquet, and the manifest also lists each
+partition's rows and bytes. As in Hive, the partition column is not stored in
+the Parquet files (it is in the path); JSON lines keep it.
+
+Downstream jobs can read shards concurrently:
+  manifest = read_manifest("filtered_combined")
+  paths = [f["path"] for f in manifest["files"] if f["format"] == "parquet"]
+or treat parquet/ as a dataset:
+  pq.read_table("filtered_combined/parquet", filters=[("language", "=", "Go")])
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 2
+CHUNK = 1024 * 1024
+JSONL_SUFFIXES = {None: ".jsonl", "zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+# Hive's (and pyarrow's) directory name for null partition values
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def conform(table, schema):
+    """Cast table to schema: missing columns become null, extra columns are dropped."""
+    columns = [
+        table.column(field.name).cast(field.type) if field.name in table.column_names
+        else pa.nulls(len(table), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def unify(schemas):
+    """One schema for several sources: the union of their fields, with all-null columns taking the other sources' type."""
+    try:
+        return pa.unify_schemas(schemas, promote_options="permissive")
+    except TypeError:  # pyarrow < 14 has no type promotion
+        return pa.unify_schemas(schemas)
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(out_dir):
+    """Load manifest.json with file paths made relative to the current directory."""
+    with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for entry in manifest["files"]:
+        entry["path"] = os.path.join(out_dir, entry["path"])
+    return manifest
+
+
+def clear_output(out_dir, formats):
+    """Remove what an earlier run wrote, so stale shards are not picked up next to the new ones."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name in formats and os.path.isdir(path):
+            shutil.rmtree(path)
+        elif name == MANIFEST_NAME or name.startswith("part-") and (".parquet" in name or ".jsonl" in name):
+            os.remove(path)
+
+
+def write_manifest(out_dir, manifest):
+    tmp = os.path.join(out_dir, MANIFEST_NAME + ".part")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_NAME))
+    return manifest
+
+
+class ShardedWriter:
+    """Cut a stream of Arrow tables into shards of about shard_bytes (uncompressed) and write them in parallel.
+
+    Tables are conformed to schema, or to the first table's schema when none
+    is given, since the source repos do not share one schema. partition is the
+    Hive directory ("" for none) and parquet_drop the columns it already encodes.
+    pool and slots let several writers share write threads and the in-flight limit.
+    rows, shards and files only count shards whose files are written and checksummed.
+    """
+
+    def __init__(self, out_dir, formats=("parquet", "jsonl"), shard_bytes=512 * 1024 * 1024, row_group_size=10000,
+                 parquet_compression="zstd", jsonl_compression="zstd", compression_level=None, workers=4,
+                 partition="", parquet_drop=(), pool=None, slots=None, schema=None):
+        self.out_dir = out_dir
+        self.formats = tuple(formats)
+        self.shard_bytes = max(1, shard_bytes)
+        self.row_group_size = max(1, row_group_size)
+        self.parquet_compression = None if parquet_compression == "none" else parquet_compression
+        self.jsonl_compression = None if jsonl_compression == "none" else jsonl_compression
+        self.compression_level = compression_level
+        self.workers = max(1, workers)
+        self.partition = partition
+        self.parquet_drop = tuple(parquet_drop)
+        self.schema = schema
+        self.rows = 0
+        self.shards = 0
+        self.files = []
+        self.pending_bytes = 0
+        self._pending = []
+        self._next_shard = 0
+        self._futures = deque()
+        self._own_pool = pool is None
+        self._pool = pool or ThreadPoolExecutor(max_workers=self.workers)
+        # At most `workers` finished shards wait in memory for (or during) their write
+        self._slots = slots or threading.BoundedSemaphore(self.workers)
+        if self._own_pool:
+            clear_output(out_dir, self.formats)
+        for fmt in self.formats:
+            os.makedirs(os.path.join(out_dir, fmt, partition), exist_ok=True)
+
+    def add_table(self, table):
+        if not len(table):
+            return
+        if self.schema is None:
+            self.schema = table.schema
+        table = conform(table, self.schema)
+        while len(table):
+            room = self.shard_bytes - self.pending_bytes
+            if table.nbytes <= room:
+                self._pending.append(table)
+                self.pending_bytes += table.nbytes
+                break
+            # Split so the shard stays near its target even when one table is larger than a shard
+            take = max(1, int(len(table) * room / max(table.nbytes, 1)))
+            self._pending.append(table.slice(0, take))
+            table = table.slice(take)
+            self.flush()
+
+    def flush(self):
+        """Hand the rows gathered so far to the write pool as one shard."""
+        if not self._pending:
+            return
+        shard = pa.concat_tables(self._pending)
+        self._pending, self.pending_bytes = [], 0
+        self._slots.acquire()
+        future = self._pool.submit(self._write_shard, self._next_shard, shard)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        self._next_shard += 1
+        while self._futures and self._futures[0].done():
+            self._collect(self._futures.popleft())
+
+    def _collect(self, future):
+        """Count a shard once its write has succeeded; re-raises the write's error otherwise."""
+        rows, entries = future.result()
+        self.rows += rows
+        self.shards += 1
+        self.files.extend(entries)
+
+    def _write_shard(self, index, table):
+        entries = []
+        for fmt in self.formats:
+            if fmt == "parquet":
+                name = f"part-{index:05d}.parquet"
+                # select() rather than drop_columns(), which needs pyarrow >= 14
+                data = table.select([c for c in table.column_names if c not in self.parquet_drop])
+            else:
+                name = f"part-{index:05d}" + JSONL_SUFFIXES[self.jsonl_compression]
+                data = table
+            rel = "/".join(p for p in (fmt, self.partition, name) if p)
+            path = os.path.join(self.out_dir, *rel.split("/"))
+            if fmt == "parquet":
+                pq.write_table(data, path + ".part", row_group_size=self.row_group_size,
+                               compression=self.parquet_compression, compression_level=self.compression_level)
+            else:
+                self._write_jsonl(data, path + ".part")
+            os.replace(path + ".part", path)
+            entries.append({
+                "path": rel,
+                "format": fmt,
+                "compression": self.parquet_compression if fmt == "parquet" else self.jsonl_compression,
+                "rows": len(table),
+                "bytes": os.path.getsize(path),
+                "sha256": sha256_file(path),
+            })
+        return len(table), entries
+
+    def _write_jsonl(self, table, path):
+        if self.jsonl_compression:
+            out = pa.CompressedOutputStream(path, self.jsonl_compression)
+        else:
+            out = pa.OSFile(path, "wb")
+        with out:
+            for batch in table.to_batches(max_chunksize=1000):
+                lines = (json.dumps(row, ensure_ascii=False, default=str) for row in batch.to_pylist())
+                out.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def finish(self):
+        """Write the remaining rows and wait for every shard; returns this writer's summary."""
+        try:
+            self.flush()
+            while self._futures:
+                self._collect(self._futures.popleft())
+        finally:
+            if self._own_pool:
+                self._pool.shutdown(wait=True)
+        return {
+            "rows": self.rows,
+            "bytes": sum(f["bytes"] for f in self.files),
+            "shards": self.shards,
+            "files": self.files,
+        }
+
+    def close(self):
+        """finish() and write manifest.json; returns the manifest."""
+        summary = self.finish()
+        return write_manifest(self.out_dir, {
+            "version": FORMAT_VERSION,
+            "rows": summary["rows"],
+            "bytes": summary["bytes"],
+            "shards": summary["shards"],
+            "row_group_size": self.row_group_size,
+            "schema": self.schema.to_string(show_schema_metadata=False) if self.schema else None,
+            "files": summary["files"],
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartitionedWriter:
+    """Write rows into one ShardedWriter per value of column, under Hive-style column=<value> directories.
+
+    Every partition is written with the same schema (the given one, or the
+    first table's), so the partitions read back as one dataset even when a
+    column is missing or all-null in some of them. The partitions share one
+    write pool. When their unwritten rows together
+    exceed max_pending_bytes, the largest partition is cut early so memory
+    stays bounded however many partitions there are.
+    """
+
+    def __init__(self, out_dir, column, formats=("parquet", "jsonl"), shard_bytes=512 * 1024 * 1024, workers=4,
+                 max_pending_bytes=None, schema=None, **shard_kwargs):
+        self.out_dir = out_dir
+        self.column = column
+        self.formats = tuple(formats)
+        self.shard_bytes = shard_bytes
+        self.workers = max(1, workers)
+        self.max_pending_bytes = max_pending_bytes or shard_bytes * 2
+        self.shard_kwargs = shard_kwargs
+        self.partitions = {}
+        self.schema = schema
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(self.workers)
+        clear_output(out_dir, self.formats)
+
+    def _writer(self, value):
+        writer = self.partitions.get(value)
+        if writer is None:
+            name = NULL_PARTITION if value is None else quote(str(value), safe="")
+            writer = ShardedWriter(self.out_dir, formats=self.formats, shard_bytes=self.shard_bytes,
+                                   workers=self.workers, partition=f"{self.column}={name}",
+                                   parquet_drop=(self.column,), pool=self._pool, slots=self._slots,
+                                   schema=self.schema, **self.shard_kwargs)
+            self.partitions[value] = writer
+        return writer
+
+    @property
+    def rows(self):
+        """Rows in the partitions' written shards."""
+        return sum(w.rows for w in self.partitions.values())
+
+    def add_table(self, table):
+        if not len(table):
+            return
+        if self.schema is None:
+            self.schema = table.schema
+        if self.column not in self.schema.names:
+            raise ValueError(f"cannot partition by missing column '{self.column}'")
+        table = conform(table, self.schema)
+        column = table.column(self.column)
+        for value in pc.unique(column).to_pylist():
+            mask = pc.is_null(column) if value is None else pc.equal(column, value)
+            self._writer(value).add_table(table.filter(mask))
+        while sum(w.pending_bytes for w in self.partitions.values()) > self.max_pending_bytes:
+            max(self.partitions.values(), key=lambda w: w.pending_bytes).flush()
+
+    def close(self):
+        """Finish every partition and write manifest.json with per-partition counts; returns the manifest."""
+        try:
+            summaries = {value: writer.finish() for value, writer in self.partitions.items()}
+        finally:
+            self._pool.shutdown(wait=True)
+        partitions = [
+            {
+                self.column: value,
+                "path": self.partitions[value].partition,
+                "rows": summary["rows"],
+                "bytes": summary["bytes"],
+                "shards": summary["shards"],
+                "bytes_by_format": {fmt: sum(f["bytes"] for f in summary["files"] if f["format"] == fmt)
+                                    for fmt in self.formats},
+            }
+            for value, summary in sorted(summaries.items(), key=lambda kv: (kv[0] is None, str(kv[0])))
+        ]
+        return write_manifest(self.out_dir, {
+            "version": FORMAT_VERSION,
+            "rows": sum(p["rows"] for p in partitions),
+            "bytes": sum(p["bytes"] for p in partitions),
+            "shards": sum(p["shards"] for p in partitions),
+            "row_group_size": self.shard_kwargs.get("row_group_size"),
+            "schema": self.schema.to_string(show_schema_metadata=False) if self.schema else None,
+            "partitioning": {"flavor": "hive", "column": self.column, "parquet_excludes_column": True},
+            "partitions": partitions,
+            "files": [f for value in summaries for f in summaries[value]["files"]],
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,99 @@
+import argparse
+import gzip
+import json
+import os
+import time
+import zlib
+from functools import partial
+
+from wet_reader import find_wet_files, iter_wet_records, map_wet_files
+
+INPUT_DIR = "Wet-Files"  # Wet-Downloader's output folder
+OUTPUT_DIR = "wet_text"
+
+
+def process_file(path, out_dir, languages, min_chars):
+    """Stream one compressed WET file into <name>.jsonl.gz of {url, date, languages, text} for the kept pages."""
+    name = os.path.basename(path)
+    stats = {"file": name, "records": 0, "kept": 0, "chars": 0, "skipped": False, "error": None}
+    out_path = None
+    if out_dir:
+        out_path = os.path.join(out_dir, name.replace(".warc.wet.gz", "").replace(".gz", "") + ".jsonl.gz")
+        if os.path.exists(out_path):
+            stats["skipped"] = True
+            return stats
+    out = gzip.open(out_path + ".part", "wt", encoding="utf-8", compresslevel=6) if out_path else None
+    try:
+        for record in iter_wet_records(path, strict=True):
+            if record.type != "conversion":
+                continue
+            stats["records"] += 1
+            if languages and not languages.intersection(record.languages[:1]):
+                continue
+            text = record.text
+            if len(text) < min_chars:
+                continue
+            stats["kept"] += 1
+            stats["chars"] += len(text)
+            if out:
+                out.write(json.dumps({"url": record.url, "date": record.date, "languages": record.languages,
+                                      "text": text}, ensure_ascii=False) + "\n")
+    except (EOFError, OSError, zlib.error, ValueError) as e:
+        # Usually a download still in progress; leave it for the next run
+        stats["error"] = str(e)
+    finally:
+        if out:
+            out.close()
+    if out_path:
+        if stats["error"]:
+            os.remove(out_path + ".part")
+        else:
+            os.replace(out_path + ".part", out_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read compressed Common Crawl WET files in place, without unzipping them first")
+    parser.add_argument("--input-dir", default=INPUT_DIR, help=f"Folder searched for .gz WET files (default: {INPUT_DIR})")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR,
+                        help=f"Per-file .jsonl.gz output of the kept pages (default: {OUTPUT_DIR})")
+    parser.add_argument("--stats-only", action="store_true", help="Only count records; write nothing")
+    parser.add_argument("--languages", nargs="+", default=None,
+                        help="Keep pages whose main detected language is one of these ISO 639-3 codes, e.g. eng deu")
+    parser.add_argument("--min-chars", type=int, default=0, help="Drop pages with less text than this")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Files processed in parallel (default: CPU count)")
+    args = parser.parse_args()
+
+    files = find_wet_files(args.input_dir)
+    if not files:
+        print(f"❌ No .gz files found in {args.input_dir}")
+        return
+    out_dir = None if args.stats_only else args.output_dir
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    print(f"✅ Found {len(files)} WET files ({sum(map(os.path.getsize, files)) / 1e9:.1f} GB). "
+          f"Reading with {args.workers} workers...")
+
+    work = partial(process_file, out_dir=out_dir, languages=set(args.languages or []), min_chars=args.min_chars)
+    totals = {"records": 0, "kept": 0, "chars": 0}
+    failed = 0
+    start = time.perf_counter()
+    for done, stats in enumerate(map_wet_files(work, files, args.workers), 1):
+        if stats["skipped"]:
+            print(f"⏭️ [{done}/{len(files)}] Skipping (already processed): {stats['file']}")
+            continue
+        if stats["error"]:
+            failed += 1
+            print(f"❌ [{done}/{len(files)}] {stats['file']}: unreadable after {stats['records']} pages ({stats['error']})")
+            continue
+        for key in totals:
+            totals[key] += stats[key]
+        print(f"📄 [{done}/{len(files)}] {stats['file']}: {stats['kept']}/{stats['records']} pages kept")
+
+    print(f"\n✅ {totals['kept']}/{totals['records']} pages kept, {totals['chars'] / 1e6:,.1f}M characters, "
+          f"in {time.perf_counter() - start:.1f}s" + (f"; output in {out_dir}" if out_dir else "")
+          + (f"; {failed} files truncated or corrupt" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
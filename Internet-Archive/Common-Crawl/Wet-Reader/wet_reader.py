@@ -0,0 +1,112 @@
+"""
+Streaming reader for Common Crawl WET files (.warc.wet.gz).
+
+WET files are multi-member gzip: one gzip member per WARC record. They are
+decompressed incrementally as records are read, so nothing is unpacked to
+disk and memory holds one record at a time:
+
+    for record in iter_wet_records("Wet-Files/CC-MAIN-...warc.wet.gz"):
+        if record.type == "conversion":
+            print(record.url, record.languages, len(record.text))
+
+map_wet_files() spreads whole files over a process pool, one file per task,
+since gzip members cannot be located without reading from the start.
+"""
+
+import gzip
+import os
+import zlib
+from multiprocessing import Pool
+
+
+class WetRecord:
+    __slots__ = ("headers", "content")
+
+    def __init__(self, headers, content):
+        self.headers = headers
+        self.content = content
+
+    @property
+    def type(self):
+        return self.headers.get("WARC-Type")
+
+    @property
+    def url(self):
+        return self.headers.get("WARC-Target-URI")
+
+    @property
+    def date(self):
+        return self.headers.get("WARC-Date")
+
+    @property
+    def languages(self):
+        """Languages detected by Common Crawl, most likely first (e.g. ["eng", "deu"])."""
+        value = self.headers.get("WARC-Identified-Content-Language")
+        return value.split(",") if value else []
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+def find_wet_files(root):
+    """Every .gz file under root, largest first so long tasks start early in a pool."""
+    paths = [os.path.join(d, name) for d, _, names in os.walk(root) for name in names if name.endswith(".gz")]
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+
+def _read_headers(stream):
+    """WARC headers of the next record, or None at the end of the stream."""
+    line = stream.readline()
+    while line in (b"\r\n", b"\n"):
+        line = stream.readline()
+    if not line:
+        return None
+    if not line.startswith(b"WARC/"):
+        raise ValueError(f"expected a WARC record, got {line[:40]!r}")
+    headers = {}
+    for line in iter(stream.readline, b""):
+        line = line.rstrip(b"\r\n")
+        if not line:
+            break
+        key, _, value = line.decode("utf-8", errors="replace").partition(":")
+        headers[key.strip()] = value.strip()
+    return headers
+
+
+def iter_wet_records(path, strict=False):
+    """Yield the WetRecords of one .warc.wet.gz file (or an uncompressed WET file) in order.
+
+    A truncated or corrupt file, e.g. one still being downloaded, ends the
+    iteration after its last complete record unless strict is set.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as stream:
+        try:
+            while True:
+                headers = _read_headers(stream)
+                if headers is None:
+                    return
+                length = int(headers.get("Content-Length", 0))
+                content = stream.read(length)
+                if len(content) < length:
+                    raise EOFError("record cut short")
+                yield WetRecord(headers, content)
+        except (EOFError, OSError, zlib.error, ValueError) as e:
+            if strict:
+                raise
+            print(f"⚠️ {os.path.basename(path)}: stopped early ({e})")
+
+
+def map_wet_files(func, paths, workers=None):
+    """Yield func(path) for every file, computed in a process pool, in completion order.
+
+    func must be a module-level function so it can be sent to the workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield func(path)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(func, paths)
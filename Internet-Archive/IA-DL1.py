@@ -1,47 +1,403 @@
+import argparse
+import hashlib
 import json
 import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+
 import requests
+from urllib3.exceptions import HTTPError as TransferError
 
-# Load dataset links from JSON
-with open("internet_archive.json", "r", encoding="utf-8") as f:
-    dataset_info = json.load(f)
+# Shared response cache and session helpers live at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
+from http_session import pooled_session
 
 # Create a folder for downloads
 DATASET_DIR = "internet_archive_datasets"
-os.makedirs(DATASET_DIR, exist_ok=True)
+DOWNLOAD_URL = "https://archive.org/download/{identifier}/{filename}"
+# Real filenames, formats, sizes and checksums of an item's files
+METADATA_URL = "https://archive.org/metadata/{identifier}/files"
+PREFERRED_FORMATS = ["PDF", "CSV", "JSON", "TXT"]
+# One JSON line per verified file: {"path", "size", "mtime_ns", "md5"/"sha1"}; the last line for a path wins
+MANIFEST_NAME = "manifest.jsonl"
+HASH_CHUNK = 1024 * 1024
 
-# Function to download datasets
-def download_file(identifier, filename):
-    url = f"https://archive.org/download/{identifier}/{filename}"
-    
-    try:
-        print(f"⬇️ Downloading: {url}")
-        response = requests.get(url, stream=True, timeout=10)
+# Reads grow or shrink between these sizes to take roughly TARGET_READ_SECONDS each
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 8 * 1024 * 1024
+TARGET_READ_SECONDS = 0.25
+TIMEOUT = (10, 60)
+
+
+def load_datasets(path):
+    """{topic: [dataset, ...]} from IA-QUERY1's internet_archive.json or its --harvest JSON lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            return json.load(f)
+        dataset_info = {}
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                dataset_info.setdefault(item.pop("topic", ""), []).append(item)
+        return dataset_info
+
+
+def unique_identifiers(dataset_info):
+    return list(dict.fromkeys(d["id"] for datasets in dataset_info.values() for d in datasets))
+
+
+def fetch_file_listing(meta_session, identifier):
+    response = meta_session.get(METADATA_URL.format(identifier=identifier), timeout=30)
+    response.raise_for_status()
+    return response.json().get("result", [])
+
+
+def local_path(out_dir, identifier, name):
+    """Where a listed file is saved, out_dir/identifier/name, or None if the name would land outside that folder.
+
+    Identifiers and names come from the server, so "..", absolute or drive parts are refused.
+    """
+    root = os.path.abspath(out_dir)
+    base = os.path.abspath(os.path.join(root, identifier))
+    path = os.path.abspath(os.path.join(base, *name.split("/")))
+    if os.path.dirname(base) != root or os.path.commonpath([base, path]) != base or path == base:
+        return None
+    return path
+
+
+def select_file(files, preferred_formats, max_bytes=None, min_bytes=0):
+    """The item's one file to fetch: earliest preferred format, originals before derivatives, then smallest.
+
+    A file matches a format by extension or by archive.org's format name
+    (e.g. "Text PDF"); metadata files and files outside the size limits are ignored.
+    """
+    best = None
+    for f in files:
+        name = f.get("name", "")
+        if f.get("source") == "metadata" or not name:
+            continue
+        size = int(f.get("size") or 0)
+        if size < min_bytes or (max_bytes and size > max_bytes):
+            continue
+        fmt = (f.get("format") or "").upper()
+        rank = next((i for i, p in enumerate(preferred_formats)
+                     if name.lower().endswith("." + p.lower()) or p.upper() in fmt), None)
+        if rank is None:
+            continue
+        key = (rank, f.get("source") != "original", size)
+        if best is None or key < best[0]:
+            best = (key, f)
+    return best[1] if best else None
+
+
+def select_downloads(meta_session, identifiers, workers, preferred_formats, max_bytes=None, min_bytes=0):
+    """Fetch every item's file listing concurrently and pick one real file per item."""
+    def pick(identifier):
+        try:
+            listing = fetch_file_listing(meta_session, identifier)
+        except Exception as e:
+            print(f"⚠️ No file listing for {identifier}: {e}")
+            return None
+        safe = [f for f in listing if local_path(".", identifier, f.get("name", ""))]
+        if len(safe) < len(listing):
+            print(f"⚠️ {identifier}: ignoring {len(listing) - len(safe)} file(s) whose names leave the item folder")
+        chosen = select_file(safe, preferred_formats, max_bytes, min_bytes)
+        if chosen is None:
+            print(f"⏭️ {identifier}: no {'/'.join(preferred_formats)} file within the size limits")
+            return None
+        return {
+            "identifier": identifier,
+            "name": chosen["name"],
+            "size": int(chosen["size"]) if chosen.get("size") else None,
+            "md5": chosen.get("md5"),
+            "sha1": chosen.get("sha1"),
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return [task for task in pool.map(pick, identifiers) if task]
+
+
+def expected_digest(task):
+    """(algorithm, hex digest) published for the file, preferring md5; (None, None) when there is none."""
+    for algo in ("md5", "sha1"):
+        if task.get(algo):
+            return algo, task[algo].lower()
+    return None, None
+
+
+def hash_file(path, algo):
+    h = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_file(path, task):
+    """True if path matches the published checksum, or the published size when there is no checksum."""
+    algo, digest = expected_digest(task)
+    if algo:
+        return hash_file(path, algo) == digest
+    return task.get("size") is None or os.path.getsize(path) == task["size"]
+
+
+class VerifiedManifest:
+    """Record of files already checked against their published checksum.
+
+    A file whose size and mtime still match its entry is trusted without
+    re-hashing, so re-runs over many finished downloads read no file data.
+    """
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["path"]] = entry
+                    except (ValueError, KeyError):
+                        continue  # torn last line from an interrupted run
+
+    def is_current(self, rel, path, task):
+        entry = self.entries.get(rel)
+        algo, digest = expected_digest(task)
+        if not entry or not algo or entry.get(algo) != digest:
+            return False
+        st = os.stat(path)
+        return entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+
+    def record(self, rel, path, task):
+        algo, digest = expected_digest(task)
+        if not algo:
+            return
+        st = os.stat(path)
+        entry = {"path": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns, algo: digest}
+        with self.lock:
+            self.entries[rel] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class Progress:
+    """Byte and file counters shared by the workers, reported periodically by a background thread."""
+
+    def __init__(self, files, interval=5.0):
+        self.lock = threading.Lock()
+        self.files = files
+        self.done = self.failed = self.skipped = 0
+        self.bytes = 0
+        self.active = {}
+        self.start = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._report, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def add(self, name, n):
+        with self.lock:
+            self.bytes += n
+            got, total = self.active.get(name, (0, 0))
+            self.active[name] = (got + n, total)
+
+    def begin(self, name, have, total):
+        with self.lock:
+            self.active[name] = (have, total)
+
+    def end(self, name, outcome):
+        with self.lock:
+            self.active.pop(name, None)
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def line(self):
+        with self.lock:
+            elapsed = max(time.perf_counter() - self.start, 1e-9)
+            active = ", ".join(f"{name} {got / total:.0%}" if total else f"{name} {got / 1e6:.1f} MB"
+                               for name, (got, total) in list(self.active.items())[:3])
+            return (f"📊 {self.done + self.skipped + self.failed}/{self.files} files, "
+                    f"{self.bytes / 1e6:,.1f} MB fetched ({self.bytes / 1e6 / elapsed:.2f} MB/s)"
+                    + (f" | {active}" if active else ""))
+
+    def _report(self, interval):
+        while not self._stop.wait(interval):
+            print(self.line())
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def content_total(response, offset):
+    """Full size of the remote file, from Content-Range on a 206 or Content-Length otherwise."""
+    match = re.search(r"/(\d+)$", response.headers.get("Content-Range", ""))
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return int(length) + (offset if response.status_code == 206 else 0) if length else None
+
+
+def fetch_once(session, url, part, progress, name):
+    """One attempt: continue part from its current size. Returns True when the file is complete."""
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    # Byte offsets and sizes must count the stored bytes, so ask for them uncompressed
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 416:
+            # Nothing left past offset: the part is complete unless the server says it is larger
+            total = content_total(response, 0)
+            if total is None or total == offset:
+                return True
+            os.remove(part)
+            return False
         response.raise_for_status()
+        if offset and response.status_code != 206:
+            offset = 0  # Range ignored; the body is the whole file
+        total = content_total(response, offset)
+        progress.begin(name, offset, total)
+
+        chunk = MIN_CHUNK
+        with open(part, "ab" if offset else "wb") as f:
+            while True:
+                started = time.perf_counter()
+                data = response.raw.read(chunk, decode_content=False)
+                if not data:
+                    break
+                f.write(data)
+                progress.add(name, len(data))
+                took = time.perf_counter() - started
+                if took < TARGET_READ_SECONDS / 2 and len(data) == chunk:
+                    chunk = min(chunk * 2, MAX_CHUNK)
+                elif took > TARGET_READ_SECONDS * 2:
+                    chunk = max(chunk // 2, MIN_CHUNK)
+        return total is None or os.path.getsize(part) >= total
+
 
-        filepath = os.path.join(DATASET_DIR, filename)
-        with open(filepath, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+def download_file(session, task, out_dir, progress, manifest, retries=5, rehash=False):
+    """Download to <file>.part, resuming with Range requests across failures and re-runs,
+    verify the published checksum, then rename.
 
-        print(f"✅ Saved: {filepath}\n")
+    A file already on disk is skipped without any request once it is known
+    (or found) to match its checksum.
+    """
+    identifier, name = task["identifier"], task["name"]
+    rel = f"{identifier}/{name}"
+    url = DOWNLOAD_URL.format(identifier=quote(identifier), filename=quote(name))
+    filepath = local_path(out_dir, identifier, name)
+    if filepath is None:
+        print(f"❌ Refusing to save {rel}: the path leaves {out_dir}")
+        progress.end(rel, "failed")
+        return "failed"
+    part = filepath + ".part"
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
-    except Exception as e:
-        print(f"❌ Failed to download {url}: {e}")
+    if os.path.exists(filepath):
+        if not rehash and manifest.is_current(rel, filepath, task):
+            progress.end(rel, "skipped")
+            return "skipped"
+        if verify_file(filepath, task):
+            manifest.record(rel, filepath, task)
+            progress.end(rel, "skipped")
+            return "skipped"
+        print(f"⚠️ {rel} does not match its published checksum; downloading it again")
+        os.remove(filepath)
+    if os.path.exists(part) and task.get("size") is not None and os.path.getsize(part) > task["size"]:
+        os.remove(part)
 
-# Loop through datasets and download files
-for topic, datasets in dataset_info.items():
-    print(f"\n🔍 Downloading datasets for: {topic}")
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    print(f"⬇️ Downloading: {url}" + (f" (resuming at {have / 1e6:.1f} MB)" if have else ""))
+    started = time.perf_counter()
+    for attempt in range(1, retries + 1):
+        try:
+            if fetch_once(session, url, part, progress, rel):
+                if verify_file(part, task):
+                    os.replace(part, filepath)
+                    manifest.record(rel, filepath, task)
+                    size = os.path.getsize(filepath)
+                    print(f"✅ Saved: {filepath} ({size / 1e6:.2f} MB in {time.perf_counter() - started:.1f}s, verified)")
+                    progress.end(rel, "done")
+                    return "done"
+                # Corrupt data cannot be resumed; start this file over
+                os.remove(part)
+                error = f"{expected_digest(task)[0] or 'size'} mismatch"
+            else:
+                error = "connection closed before the end of the file"
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                print(f"❌ Failed to download {url}: {e}")
+                progress.end(rel, "failed")
+                return "failed"
+            error = e
+        except (requests.RequestException, TransferError, OSError) as e:
+            error = e
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 30))
+            print(f"🔁 Retrying {rel} ({attempt}/{retries - 1}) after: {error}")
+    print(f"❌ Failed to download {url}: {error} (partial data kept for the next run)")
+    progress.end(rel, "failed")
+    return "failed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the files listed by IA-QUERY1.py from archive.org")
+    parser.add_argument("--input", default="internet_archive.json",
+                        help="internet_archive.json or the .jsonl written by IA-QUERY1.py --harvest")
+    parser.add_argument("--output-dir", default=DATASET_DIR, help=f"Download folder (default: {DATASET_DIR})")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent downloads (default: 4)")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Attempts per file; each one resumes where the last stopped (default: 5)")
+    parser.add_argument("--progress-interval", type=float, default=5.0,
+                        help="Seconds between overall progress lines (default: 5)")
+    parser.add_argument("--formats", nargs="+", default=PREFERRED_FORMATS,
+                        help=f"Format preference, best first (default: {' '.join(PREFERRED_FORMATS)})")
+    parser.add_argument("--max-size-mb", type=float, default=None, help="Skip files larger than this")
+    parser.add_argument("--min-size-kb", type=float, default=0, help="Skip files smaller than this")
+    parser.add_argument("--metadata-workers", type=int, default=16,
+                        help="Concurrent file-listing requests (default: 16)")
+    parser.add_argument("--rehash", action="store_true",
+                        help="Re-hash files on disk instead of trusting the verified manifest")
+    args = parser.parse_args()
+
+    # Load dataset links from JSON
+    dataset_info = load_datasets(args.input)
+    os.makedirs(args.output_dir, exist_ok=True)
+    identifiers = unique_identifiers(dataset_info)
+    print(f"🔍 Listing files of {len(identifiers)} items from {len(dataset_info)} topics...")
+
+    # Listings rarely change; cached for a week in the shared response cache
+    meta_session = CachedSession("internet_archive_metadata", ttl=7 * 86400,
+                                 session=pooled_session(args.metadata_workers, retries=3, hosts=4))
+    max_bytes = args.max_size_mb * 1e6 if args.max_size_mb else None
+    files = select_downloads(meta_session, identifiers, args.metadata_workers, args.formats, max_bytes,
+                             args.min_size_kb * 1e3)
+    total = sum(task["size"] or 0 for task in files)
+    print(f"📋 {len(files)} files selected ({total / 1e6:,.1f} MB), {args.workers} download workers")
+
+    session = pooled_session(args.workers, retries=3, hosts=4)
+    manifest = VerifiedManifest(args.output_dir)
+    progress = Progress(len(files), args.progress_interval)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = [pool.submit(download_file, session, task, args.output_dir, progress, manifest,
+                                   max(1, args.retries), args.rehash)
+                       for task in files]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        progress.close()
 
-    for dataset in datasets:
-        identifier = dataset["id"]
-        formats = dataset["formats"]
+    print(progress.line())
+    print(f"\n✅ Done: {progress.done} downloaded and verified, {progress.skipped} already verified, "
+          f"{progress.failed} failed.")
 
-        # Pick a preferred format
-        for preferred_format in ["PDF", "CSV", "JSON", "TXT"]:
-            for fmt in formats:
-                if preferred_format in fmt:
-                    filename = f"{identifier}.{preferred_format.lower()}"
-                    download_file(identifier, filename)
 
-print("\n✅ All possible datasets downloaded!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
-import requests
+import argparse
 import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Internet Archive API Base URL
+# Shared response cache and session helpers live at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
+from http_session import pooled_session
+
+# Internet Archive API Base URLs
 IA_API_URL = "https://archive.org/advancedsearch.php"
+# Cursor-paginated search for complete result sets (count must be 100..10000)
+IA_SCRAPE_URL = "https://archive.org/services/search/v1/scrape"
+FIELDS = ["identifier", "title", "year", "mediatype", "format"]
 
 # Topics to search for
 search_topics = [
@@ -13,45 +26,144 @@ search_topics = [
     "Zero-Knowledge Proofs", "Homomorphic Encryption"
 ]
 
+
+def make_session(workers):
+    """Cached session for the advanced search; scrape API cursors expire, so harvesting uses pooled_session()."""
+    return CachedSession("internet_archive", ttl=86400, session=pooled_session(workers))
+
+
+def to_dataset(item):
+    formats = item.get("format", [])
+    return {
+        "title": item.get("title", "Unknown Title"),
+        "year": item.get("year", "Unknown Year"),
+        "id": item["identifier"],
+        "media_type": item.get("mediatype", "Unknown"),
+        "formats": formats if isinstance(formats, list) else [formats],
+    }
+
+
 # Function to search Internet Archive
-def search_internet_archive(topic):
+def search_internet_archive(session, topic, rows=20):
     print(f"\n🔍 Searching Internet Archive for: {topic}")
-    
+
     params = {
         "q": topic,
-        "fl[]": "identifier,title,year,mediatype,format",
+        "fl[]": ",".join(FIELDS),
         "output": "json",
-        "rows": 20  # Adjust this for more results
+        "rows": rows,
     }
 
-    response = requests.get(IA_API_URL, params=params)
-    
+    response = session.get(IA_API_URL, params=params, timeout=30)
+
     if response.status_code == 200:
-        results = response.json()["response"]["docs"]
-        datasets = []
-
-        for item in results:
-            datasets.append({
-                "title": item.get("title", "Unknown Title"),
-                "year": item.get("year", "Unknown Year"),
-                "id": item["identifier"],
-                "media_type": item.get("mediatype", "Unknown"),
-                "formats": item.get("format", [])
-            })
-        
-        return datasets
+        return [to_dataset(item) for item in response.json()["response"]["docs"]]
     else:
         print(f"❌ Error fetching results for {topic}. Status Code: {response.status_code}")
         return []
 
-# Run search for all topics
-all_datasets = {}
 
-for topic in search_topics:
-    all_datasets[topic] = search_internet_archive(topic)
+def harvest_topic(session, topic, on_page, page_size=10000):
+    """Follow the scrape API cursor until the result set is exhausted, handing each page to on_page.
+
+    Only one page is held at a time. Returns (items harvested, total reported by the API).
+    """
+    params = {"q": topic, "fields": ",".join(FIELDS), "count": max(100, min(page_size, 10000))}
+    harvested, total = 0, None
+    while True:
+        response = session.get(IA_SCRAPE_URL, params=params, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code} after {harvested} items")
+        data = response.json()
+        if "error" in data:
+            raise RuntimeError(f"{data['error']} after {harvested} items")
+        items = data.get("items", [])
+        total = data.get("total", total)
+        if items:
+            on_page(topic, [to_dataset(item) for item in items])
+            harvested += len(items)
+        cursor = data.get("cursor")
+        if not cursor or not items:
+            return harvested, total
+        params["cursor"] = cursor
+
+
+class JsonlSink:
+    """Thread-safe JSON-lines output, one {"topic", ...dataset} object per line, flushed per page."""
+
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, topic, datasets):
+        lines = "".join(json.dumps({"topic": topic, **d}, ensure_ascii=False) + "\n" for d in datasets)
+        with self.lock:
+            self.f.write(lines)
+            self.f.flush()
+            self.count += len(datasets)
+
+    def close(self):
+        self.f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the Internet Archive for datasets on each topic")
+    parser.add_argument("--topics", nargs="+", default=search_topics, help="Topics to search for")
+    parser.add_argument("--harvest", action="store_true",
+                        help="Pull every matching item via the cursor-based scrape API, streamed to JSON lines")
+    parser.add_argument("--rows", type=int, default=20, help="Results per topic without --harvest (default: 20)")
+    parser.add_argument("--page-size", type=int, default=10000,
+                        help="Items per scrape API page with --harvest, 100-10000 (default: 10000)")
+    parser.add_argument("--workers", type=int, default=4, help="Topics searched concurrently (default: 4)")
+    parser.add_argument("--output", default=None,
+                        help="Output file (default: internet_archive.json, or internet_archive.jsonl with --harvest)")
+    args = parser.parse_args()
+    output = args.output or ("internet_archive.jsonl" if args.harvest else "internet_archive.json")
+
+    start = time.perf_counter()
+
+    if args.harvest:
+        # Not cached: a replayed first page would hand back a cursor that may have expired
+        session = pooled_session(args.workers)
+        sink = JsonlSink(output)
+
+        def run(topic):
+            print(f"🔍 Harvesting Internet Archive for: {topic}")
+            try:
+                harvested, total = harvest_topic(session, topic, sink, args.page_size)
+                print(f"✅ {topic}: {harvested} items (API total: {total})")
+            except Exception as e:
+                print(f"❌ Harvest failed for {topic}: {e}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+                list(pool.map(run, args.topics))
+        finally:
+            sink.close()
+        print(f"\n✅ {sink.count} items for {len(args.topics)} topics streamed to {output} "
+              f"in {time.perf_counter() - start:.1f}s")
+        return
+
+    session = make_session(args.workers)
+
+    def search(topic):
+        try:
+            return search_internet_archive(session, topic, args.rows)
+        except Exception as e:
+            print(f"❌ Search failed for {topic}: {e}")
+            return []
+
+    # Run search for all topics
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        all_datasets = dict(zip(args.topics, pool.map(search, args.topics)))
+
+    # Save results to JSON
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(all_datasets, f, indent=4)
+
+    print(f"\n✅ All dataset links saved to {output}")
 
-# Save results to JSON
-with open("internet_archive.json", "w", encoding="utf-8") as f:
-    json.dump(all_datasets, f, indent=4)
 
-print("\n✅ All dataset links saved to internet_archive.json")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
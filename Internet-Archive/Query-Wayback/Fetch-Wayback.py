@@ -0,0 +1,352 @@
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+# Shared HTTP helpers live at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from http_session import pooled_session
+
+# id_ serves the capture as archived, without the Wayback toolbar or rewritten links
+RAW_URL = "https://web.archive.org/web/{timestamp}id_/{original}"
+ARCHIVE_URL_RE = re.compile(r"/web/(\d{1,14})[a-z_]*/(.+)$")
+USER_AGENT = "aptlantisbot/1.0"
+INDEX_NAME = "index.cdx"
+CDX_HEADER = " CDX N b a m s k r M S V g\n"
+WARC_PATTERN = "wayback-{:05d}.warc.gz"
+CHUNK = 1024 * 1024
+SPOOL_BYTES = 8 * 1024 * 1024
+# Hop-by-hop and encoding headers that no longer describe the stored payload
+DROP_HEADERS = {"content-length", "transfer-encoding", "content-encoding", "connection"}
+
+
+def iter_snapshots(path):
+    """Snapshots from Query-Wayback output: snapshots.jsonl lines, or the older snapshots.json list."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            records = json.load(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if "timestamp" not in record:
+                match = ARCHIVE_URL_RE.search(record.get("archive_url", ""))
+                if not match:
+                    continue
+                record = dict(record, timestamp=match.group(1), original=match.group(2))
+            yield record
+
+
+def surt(url):
+    """Sort-friendly URL key as used in CDX files, e.g. org,example)/path?q."""
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = ",".join(reversed(host.split("."))) + ")" + (parts.path or "/").lower()
+    return key + ("?" + parts.query.lower() if parts.query else "")
+
+
+def cdx_field(value):
+    """Percent-encode whitespace, which would split a space-separated CDX line into extra fields."""
+    return re.sub(r"\s", lambda m: quote(m.group()), value)
+
+
+def sha1_base32(h):
+    return "sha1:" + base64.b32encode(h.digest()).decode("ascii")
+
+
+def warc_date(timestamp):
+    ts = (timestamp + "00000000000000")[:14]
+    return f"{ts[0:4]}-{ts[4:6]}-{ts[6:8]}T{ts[8:10]}:{ts[10:12]}:{ts[12:14]}Z"
+
+
+class WarcWriter:
+    """Rotating .warc.gz files, one gzip member per record, indexed in a CDX file.
+
+    Every record is its own gzip member, so it can be read back with a seek
+    to its offset and a single decompress. Index lines are only written after
+    their record is flushed; on restart the last WARC is cut back to the end
+    of its last indexed record and writing continues in a new file.
+    """
+
+    def __init__(self, out_dir, max_bytes):
+        self.out_dir = out_dir
+        self.max_bytes = max(1, max_bytes)
+        self.lock = threading.Lock()
+        self.digests = set()
+        self.host_counts = {}
+        self.records = 0
+        os.makedirs(out_dir, exist_ok=True)
+        self.index_path = os.path.join(out_dir, INDEX_NAME)
+        ends = self._load_index()
+        existing = sorted(int(m.group(1)) for m in
+                          (re.match(r"wayback-(\d{5})\.warc\.gz$", n) for n in os.listdir(out_dir)) if m)
+        if existing:
+            last = WARC_PATTERN.format(existing[-1])
+            last_path = os.path.join(out_dir, last)
+            if last in ends:
+                with open(last_path, "r+b") as f:
+                    f.truncate(ends[last])
+            else:
+                os.remove(last_path)  # nothing in it was indexed
+        self.number = existing[-1] + 1 if existing else 0
+        self.index = open(self.index_path, "a", encoding="utf-8")
+        if self.index.tell() == 0:
+            self.index.write(CDX_HEADER)
+        self.f = None
+        self._open()
+
+    def _load_index(self):
+        """Collect digests and per-host counts already stored; returns the end offset of each WARC's last record."""
+        ends = {}
+        if not os.path.exists(self.index_path):
+            return ends
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split(" ")
+                if len(fields) != 11 or line.startswith(" CDX"):
+                    continue
+                _, _, original, _, _, digest, _, _, length, offset, name = fields
+                self.digests.add(digest)
+                host = urlsplit(original).hostname or ""
+                self.host_counts[host] = self.host_counts.get(host, 0) + 1
+                ends[name] = max(ends.get(name, 0), int(offset) + int(length))
+                self.records += 1
+        return ends
+
+    def _open(self):
+        self.name = WARC_PATTERN.format(self.number)
+        self.f = open(os.path.join(self.out_dir, self.name), "ab")
+        info = f"software: Fetch-Wayback.py\r\nformat: WARC File Format 1.1\r\nhttp-header-user-agent: {USER_AGENT}\r\n"
+        self._write_record({
+            "WARC-Type": "warcinfo",
+            "WARC-Date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "WARC-Filename": self.name,
+            "Content-Type": "application/warc-fields",
+        }, [info.encode("utf-8")])
+
+    def _write_record(self, headers, blocks, block_length=None):
+        """Write one gzip-member record from an iterable of blocks; returns (offset, compressed length)."""
+        block_length = sum(len(b) for b in blocks) if block_length is None else block_length
+        head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in {
+            "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>", **headers, "Content-Length": block_length}.items())
+        offset = self.f.tell()
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self.f.write(gz.compress((head + "\r\n").encode("utf-8")))
+        for block in blocks:
+            self.f.write(gz.compress(block))
+        self.f.write(gz.compress(b"\r\n\r\n") + gz.flush())
+        self.f.flush()
+        return offset, self.f.tell() - offset
+
+    def claim(self, digest, host, max_per_host):
+        """Reserve a capture for fetching unless its digest is taken or its host's budget is spent."""
+        with self.lock:
+            if digest and digest in self.digests:
+                return "duplicate"
+            if max_per_host and self.host_counts.get(host, 0) >= max_per_host:
+                return "over budget"
+            if digest:
+                self.digests.add(digest)
+            self.host_counts[host] = self.host_counts.get(host, 0) + 1
+            return None
+
+    def release(self, digest, host):
+        """Undo claim() for a failed fetch, so another capture with the same payload can be tried."""
+        with self.lock:
+            self.digests.discard(digest)
+            self.host_counts[host] -= 1
+
+    def write_response(self, snapshot, status, reason, http_headers, payload, payload_length, payload_digest):
+        """Store a fetched capture as a response record; returns False if its payload is already stored."""
+        head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in http_headers)
+        head = (head + f"Content-Length: {payload_length}\r\n\r\n").encode("latin-1", "replace")
+        block = hashlib.sha1(head)
+        payload.seek(0)
+        for chunk in iter(lambda: payload.read(CHUNK), b""):
+            block.update(chunk)
+        payload.seek(0)
+        with self.lock:
+            # The CDX digest can be missing (old snapshots.json) or differ from what was served
+            if payload_digest != snapshot.get("digest") and payload_digest in self.digests:
+                # Nothing is stored, so the host budget taken in claim() is given back
+                self.host_counts[urlsplit(snapshot["original"]).hostname or ""] -= 1
+                return False
+            self.digests.add(payload_digest)
+            offset, length = self._write_record({
+                "WARC-Type": "response",
+                "WARC-Date": warc_date(snapshot["timestamp"]),
+                "WARC-Target-URI": snapshot["original"],
+                "WARC-Payload-Digest": "sha1:" + payload_digest,
+                "WARC-Block-Digest": sha1_base32(block),
+                "Content-Type": "application/http; msgtype=response",
+            }, itertools.chain([head], iter(lambda: payload.read(CHUNK), b"")), len(head) + payload_length)
+            mimetype = snapshot.get("mimetype") or dict((k.lower(), v) for k, v in http_headers).get(
+                "content-type", "-").split(";")[0].strip() or "-"
+            self.index.write(" ".join([
+                cdx_field(surt(snapshot["original"])), snapshot["timestamp"], cdx_field(snapshot["original"]),
+                mimetype.replace(" ", ""),
+                str(status), payload_digest, "-", "-", str(length), str(offset), self.name,
+            ]) + "\n")
+            self.index.flush()
+            self.records += 1
+            if self.f.tell() >= self.max_bytes:
+                self.f.close()
+                self.number += 1
+                self._open()
+        return True
+
+    def close(self):
+        """Close the files and sort the index by URL key and timestamp, as CDX readers expect."""
+        self.f.close()
+        self.index.close()
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            lines = sorted(line for line in f if not line.startswith(" CDX"))
+        tmp = self.index_path + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(CDX_HEADER)
+            f.writelines(lines)
+        os.replace(tmp, self.index_path)
+
+
+class RateLimiter:
+    """Spaces request starts 1/rate seconds apart across all workers; every fetch goes to web.archive.org."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+class HostLimiter:
+    """At most `limit` concurrent fetches per original host."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.lock = threading.Lock()
+        self.slots = {}
+
+    def __call__(self, host):
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = threading.BoundedSemaphore(self.limit)
+            return self.slots[host]
+
+
+def fetch_capture(session, writer, snapshot, max_bytes):
+    """Download one raw capture into a spooled file and store it. Returns "stored", "duplicate" or raises."""
+    url = RAW_URL.format(timestamp=snapshot["timestamp"], original=snapshot["original"])
+    # Redirect captures are stored as the redirect they were, not followed
+    with session.get(url, stream=True, timeout=(10, 120), allow_redirects=False) as response:
+        # An archived 404 replays as 404; only errors the capture did not have are failures
+        if response.status_code >= 400 and str(response.status_code) != snapshot.get("statuscode"):
+            response.raise_for_status()
+        # id_ replays the archived headers as x-archive-orig-*
+        headers = [(k[len("x-archive-orig-"):], v) for k, v in response.headers.items()
+                   if k.lower().startswith("x-archive-orig-") and k[len("x-archive-orig-"):].lower() not in DROP_HEADERS]
+        if not any(k.lower() == "content-type" for k, _ in headers) and "Content-Type" in response.headers:
+            headers.append(("Content-Type", response.headers["Content-Type"]))
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as payload:
+            digest, size = hashlib.sha1(), 0
+            for chunk in response.iter_content(CHUNK):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise ValueError(f"capture larger than {max_bytes / 1e6:.0f} MB")
+                digest.update(chunk)
+                payload.write(chunk)
+            payload_digest = base64.b32encode(digest.digest()).decode("ascii")
+            stored = writer.write_response(snapshot, response.status_code, response.reason, headers,
+                                           payload, size, payload_digest)
+    return "stored" if stored else "duplicate"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch unique Wayback captures into compressed WARC files with a CDX index")
+    parser.add_argument("--input", default="snapshots.jsonl",
+                        help="Query-Wayback.py output, .jsonl or the older .json list (default: snapshots.jsonl)")
+    parser.add_argument("--output-dir", default="wayback_warc", help="WARC and index folder (default: wayback_warc)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent fetches in total (default: 8)")
+    parser.add_argument("--per-host", type=int, default=2, help="Concurrent fetches per original host (default: 2)")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Requests per second to web.archive.org across all workers; 0 for no limit (default: 2)")
+    parser.add_argument("--max-per-host", type=int, default=0,
+                        help="Captures stored per original host, counting earlier runs (default: no limit)")
+    parser.add_argument("--max-capture-mb", type=float, default=100, help="Skip captures larger than this (default: 100)")
+    parser.add_argument("--warc-size-mb", type=float, default=1000, help="Start a new WARC file after this size (default: 1000)")
+    args = parser.parse_args()
+
+    writer = WarcWriter(args.output_dir, int(args.warc_size_mb * 1e6))
+    # identity: payloads are stored and digested exactly as served
+    session = pooled_session(args.workers, retries=5, backoff=2.0,
+                             headers={"User-Agent": USER_AGENT, "Accept-Encoding": "identity"})
+    limiter = HostLimiter(args.per_host)
+    archive_rate = RateLimiter(args.rate)
+    counts = {"stored": 0, "duplicate": 0, "over budget": 0, "failed": 0}
+    counts_lock = threading.Lock()
+    # Bounds the snapshots read ahead of the workers, so the input can be any size
+    in_flight = threading.BoundedSemaphore(args.workers * 4)
+    if writer.records:
+        print(f"🔁 Resuming: {writer.records} captures already stored in {args.output_dir}")
+    start = time.perf_counter()
+
+    def count(outcome):
+        with counts_lock:
+            counts[outcome] += 1
+            total = sum(counts.values())
+        if total % 500 == 0:
+            print(f"📊 {total} snapshots: {counts['stored']} stored, {counts['duplicate']} duplicate, "
+                  f"{counts['over budget']} over host budget, {counts['failed']} failed")
+
+    def run(snapshot, host):
+        try:
+            with limiter(host):
+                archive_rate.wait()
+                count(fetch_capture(session, writer, snapshot, args.max_capture_mb * 1e6))
+        except Exception as e:
+            writer.release(snapshot.get("digest"), host)
+            print(f"❌ {snapshot['timestamp']} {snapshot['original']}: {e}")
+            count("failed")
+        finally:
+            in_flight.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for snapshot in iter_snapshots(args.input):
+                host = urlsplit(snapshot["original"]).hostname or ""
+                skipped = writer.claim(snapshot.get("digest"), host, args.max_per_host)
+                if skipped:
+                    count(skipped)
+                    continue
+                in_flight.acquire()
+                pool.submit(run, snapshot, host)
+    finally:
+        writer.close()
+
+    print(f"\n✅ {counts['stored']} captures stored, {counts['duplicate']} duplicates skipped, "
+          f"{counts['over budget']} over host budget, {counts['failed']} failed "
+          f"({time.perf_counter() - start:.1f}s); index: {writer.index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,189 @@
+import argparse
 import json
-from waybackpy import WaybackMachineCDXServerAPI
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-cdx = WaybackMachineCDXServerAPI("linuxtracker.org", user_agent="aptlantisbot/1.0")
-results = []
+# Shared HTTP helpers live at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from http_session import pooled_session
 
-for page in cdx.snapshots():
-    results.append({
-        "archive_url": page.archive_url,
-        "length": page.length
-    })
+CDX_URL = "https://web.archive.org/cdx/search/cdx"
+ARCHIVE_URL = "https://web.archive.org/web/{timestamp}/{original}"
+FIELDS = ["urlkey", "timestamp", "original", "mimetype", "statuscode", "digest", "length"]
+USER_AGENT = "aptlantisbot/1.0"
+DEFAULT_TARGETS = ["linuxtracker.org"]
 
-with open("snapshots.json", "w") as f:
-    json.dump(results, f, indent=2)
\ No newline at end of file
+
+def load_targets(args):
+    targets = list(args.targets or [])
+    if args.targets_file:
+        with open(args.targets_file, "r", encoding="utf-8") as f:
+            targets += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return list(dict.fromkeys(targets or DEFAULT_TARGETS))
+
+
+def build_query(args):
+    """CDX parameters shared by every target; stored in the state file so a resume uses the same query."""
+    query = {"output": "json", "fl": ",".join(FIELDS), "showResumeKey": "true", "limit": args.page_size}
+    if args.collapse:
+        query["collapse"] = args.collapse
+    if args.filter:
+        query["filter"] = args.filter
+    if args.start:
+        query["from"] = args.start
+    if args.end:
+        query["to"] = args.end
+    return query
+
+
+def match_type(target, requested):
+    if requested != "auto":
+        return requested
+    # A bare domain means the whole domain; anything with a path is a URL prefix
+    return "prefix" if "/" in target.split("://", 1)[-1] else "domain"
+
+
+def fetch_page(session, target, query, match, resume_key=None):
+    """One CDX page as (records, next resume key or None)."""
+    params = dict(query, url=target, matchType=match)
+    if resume_key:
+        params["resumeKey"] = resume_key
+    response = session.get(CDX_URL, params=params, timeout=(10, 120))
+    response.raise_for_status()
+    data = response.json() if response.text.strip() else []
+    next_key = None
+    # With showResumeKey the last two rows are [] and [resumeKey] when more results remain
+    if len(data) >= 2 and data[-2] == []:
+        next_key = data[-1][0]
+        data = data[:-2]
+    header, rows = (data[0], data[1:]) if data else (FIELDS, [])
+    records = []
+    for row in rows:
+        record = dict(zip(header, row))
+        record.pop("urlkey", None)
+        record["archive_url"] = ARCHIVE_URL.format(timestamp=record["timestamp"], original=record["original"])
+        records.append({"target": target, **record})
+    return records, next_key
+
+
+class ResumableJsonl:
+    """JSON-lines output plus a state file holding each target's resume key.
+
+    After every page the records are flushed and the state is replaced
+    atomically, recording the output size it covers. On restart the output is
+    cut back to that size, so a page written before a crash is not duplicated.
+    """
+
+    def __init__(self, path, state_path, query, restart=False):
+        self.path = path
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.state = {"query": query, "offset": 0, "targets": {}}
+        if not restart and os.path.exists(state_path) and os.path.exists(path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("query") != query:
+                raise SystemExit(f"❌ {state_path} was written for a different query; "
+                                 f"use --restart or another --output")
+            self.state = state
+        if self.state["offset"]:
+            self.f = open(path, "r+b")
+            self.f.truncate(self.state["offset"])
+            self.f.seek(self.state["offset"])
+        else:
+            self.f = open(path, "wb")
+
+    def progress(self, target):
+        return self.state["targets"].get(target, {"resume_key": None, "records": 0, "pages": 0, "done": False})
+
+    def write_page(self, target, records, resume_key):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with self.lock:
+            self.f.write(data)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            entry = self.progress(target)
+            self.state["targets"][target] = {
+                "resume_key": resume_key,
+                "records": entry["records"] + len(records),
+                "pages": entry["pages"] + 1,
+                "done": resume_key is None,
+            }
+            self.state["offset"] = self.f.tell()
+            tmp = self.state_path + ".part"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp, self.state_path)
+            return self.state["targets"][target]
+
+    def close(self):
+        self.f.close()
+
+
+def harvest_target(session, sink, target, query, match):
+    entry = sink.progress(target)
+    if entry["done"]:
+        print(f"⏭️ {target}: already complete ({entry['records']} records)")
+        return entry["records"]
+    if entry["resume_key"]:
+        print(f"🔁 {target}: resuming after {entry['records']} records")
+    else:
+        print(f"🔍 Harvesting CDX records for {target} ({match})")
+    resume_key = entry["resume_key"]
+    while True:
+        records, resume_key = fetch_page(session, target, query, match, resume_key)
+        entry = sink.write_page(target, records, resume_key)
+        if resume_key is None:
+            print(f"✅ {target}: {entry['records']} records in {entry['pages']} pages")
+            return entry["records"]
+        if entry["pages"] % 10 == 0:
+            print(f"📄 {target}: {entry['records']} records so far")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream Wayback Machine CDX records for domains or URL prefixes to JSON lines")
+    parser.add_argument("targets", nargs="*", help=f"Domains or URL prefixes (default: {' '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--targets-file", help="File with one domain or URL prefix per line")
+    parser.add_argument("--match-type", choices=["auto", "exact", "prefix", "host", "domain"], default="auto",
+                        help="CDX matchType; auto uses domain for bare domains and prefix for URLs (default: auto)")
+    parser.add_argument("--collapse", action="append",
+                        help="Server-side collapse, e.g. 'digest' to keep one capture per distinct content (repeatable)")
+    parser.add_argument("--filter", action="append",
+                        help="CDX filter, e.g. 'statuscode:200' or '!mimetype:warc/revisit' (repeatable)")
+    parser.add_argument("--from", dest="start", help="Earliest timestamp, e.g. 2010 or 20100101")
+    parser.add_argument("--to", dest="end", help="Latest timestamp")
+    parser.add_argument("--page-size", type=int, default=5000, help="Records per CDX request (default: 5000)")
+    parser.add_argument("--workers", type=int, default=4, help="Targets harvested concurrently (default: 4)")
+    parser.add_argument("--output", default="snapshots.jsonl", help="Output JSON lines (default: snapshots.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and start over")
+    args = parser.parse_args()
+
+    targets = load_targets(args)
+    query = build_query(args)
+    sink = ResumableJsonl(args.output, args.output + ".state.json", query, args.restart)
+    session = pooled_session(args.workers, retries=6, backoff=2.0, headers={"User-Agent": USER_AGENT})
+    start = time.perf_counter()
+
+    def run(target):
+        try:
+            return harvest_target(session, sink, target, query, match_type(target, args.match_type))
+        except Exception as e:
+            print(f"❌ {target}: {e} (progress saved; re-run to resume)")
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            results = list(pool.map(run, targets))
+    finally:
+        sink.close()
+
+    failed = sum(r is None for r in results)
+    print(f"\n✅ {sum(r or 0 for r in results)} records for {len(targets) - failed}/{len(targets)} targets "
+          f"in {args.output} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 import json
-import time
+
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
 
 # Base URL for MITRE ATT&CK techniques
 BASE_URL = "https://attack.mitre.org/techniques/enterprise/"
 
+# Technique pages rarely change; pause 2s between real requests to avoid overwhelming the server
+session = CachedSession("mitre", ttl=7 * 86400, min_interval=2.0)
+
 # Function to scrape MITRE ATT&CK techniques
 def scrape_mitre_attack():
     print("🔍 Scraping MITRE ATT&CK database...")
-    response = requests.get(BASE_URL)
+    response = session.get(BASE_URL)
     if response.status_code != 200:
         print(f"❌ Failed to access {BASE_URL}")
         return []
@@ -44,13 +51,12 @@ def scrape_mitre_attack():
         })
 
         print(f"✅ Scraped: {technique_name} ({technique_id})")
-        time.sleep(2)  # Pause to avoid overwhelming the server
 
     return techniques
 
 # Function to scrape details from individual technique pages
 def scrape_technique_details(url):
-    response = requests.get(url)
+    response = session.get(url)
     if response.status_code != 200:
         print(f"❌ Failed to fetch details for {url}")
         return {}
@@ -1,10 +1,16 @@
-import requests
+import sys
 from bs4 import BeautifulSoup
 import json
 import os
-import time
 from datetime import datetime
 
+# Shared response cache lives at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from http_cache import CachedSession
+
+# Articles change slowly; 1s between real requests prevents overloading Wikipedia's servers
+session = CachedSession("wikipedia", ttl=30 * 86400, min_interval=1.0)
+
 # Load structured search topics JSON
 TOPIC_JSON_FILE = "search_topics.json"
 
@@ -24,7 +30,7 @@ def scrape_page(url, depth=0):
     if depth > MAX_BRANCHES:
         return []
 
-    response = requests.get(url)
+    response = session.get(url)
     if response.status_code != 200:
         print(f"Failed to fetch {url}")
         return []
@@ -66,7 +72,6 @@ def scrape_page(url, depth=0):
 
     # Recursively scrape the valid links
     for full_link in valid_links[:MAX_BRANCHES]:
-        time.sleep(1)  # Prevents overloading Wikipedia's servers
         dataset.extend(scrape_page(full_link, depth + 1))
 
     return dataset
@@ -0,0 +1,253 @@
+"""
+Shared on-disk HTTP response cache for the scrapers in this repo.
+
+Responses are keyed by the normalized request (method + URL with params merged,
+query sorted, fragment dropped), stored zlib-compressed and content-addressed
+(identical bodies are kept once), and indexed in SQLite. Each scraper picks its
+own TTL; the cache as a whole is capped in size with least-recently-used eviction.
+
+Usage (scripts live one folder below this file):
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+  from http_cache import CachedSession
+
+  session = CachedSession("mitre", ttl=7 * 86400, min_interval=2.0)
+  response = session.get(url, timeout=20)   # a regular requests.Response
+  response.from_cache                       # True when served from disk
+
+With stream=True the body is read only as far as the caller reads it, and is
+cached only if read to the end.
+
+Environment:
+  HTTP_CACHE_DIR           cache location (default: ~/.cache/scraper-http)
+  HTTP_CACHE_MAX_MB        size cap in MB (default: 2048)
+  HTTP_CACHE_OFFLINE=1     cache-only: serve even stale entries, raise CacheMiss on a miss
+  HTTP_CACHE_DISABLE=1     bypass the cache entirely
+  HTTP_CACHE_TTL_<SOURCE>  override one scraper's TTL in seconds, e.g. HTTP_CACHE_TTL_MITRE=0
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, stream_decode_response_unicode
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "scraper-http")
+DEFAULT_MAX_MB = 2048
+
+
+class CacheMiss(requests.ConnectionError):
+    """Raised in offline mode when a request has no cached response."""
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def normalize_request_url(url, params=None):
+    """Canonical URL for a GET with params: lowercase scheme/host, sorted query, no fragment."""
+    if params:
+        url = requests.Request("GET", url, params=params).prepare().url
+    pu = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(pu.query, keep_blank_values=True)))
+    return urlunsplit((pu.scheme.lower(), pu.netloc.lower(), pu.path or "/", query, ""))
+
+
+class CachedSession:
+    """requests-compatible get() backed by the shared response cache.
+
+    source names the scraper (for per-source TTL overrides and bookkeeping).
+    min_interval spaces real network requests; cache hits are never delayed.
+    """
+
+    def __init__(self, source, ttl=86400, min_interval=0.0, cache_dir=None, max_bytes=None, offline=None,
+                 session=None):
+        self.source = source
+        self.ttl = float(os.environ.get(f"HTTP_CACHE_TTL_{source.upper()}", ttl))
+        self.min_interval = min_interval
+        self.cache_dir = cache_dir or os.environ.get("HTTP_CACHE_DIR") or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("HTTP_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.offline = _env_flag("HTTP_CACHE_OFFLINE") if offline is None else offline
+        self.disabled = _env_flag("HTTP_CACHE_DISABLE")
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+
+        os.makedirs(os.path.join(self.cache_dir, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=60,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, url TEXT NOT NULL, final_url TEXT NOT NULL, source TEXT NOT NULL,
+                status INTEGER NOT NULL, headers TEXT NOT NULL, blob TEXT NOT NULL, size INTEGER NOT NULL,
+                stored_at REAL NOT NULL, accessed_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS entries_blob ON entries (blob);
+        """)
+
+    # -- public API -------------------------------------------------------
+
+    def get(self, url, params=None, **kwargs):
+        """Like requests.get(); served from the cache when a fresh entry exists."""
+        if self.disabled:
+            self._pace()
+            resp = self.session.get(url, params=params, **kwargs)
+            resp.from_cache = False
+            return resp
+
+        key_url = normalize_request_url(url, params)
+        key = self._key(key_url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT final_url, status, headers, blob, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row and (self.offline or time.time() - row[4] < self.ttl):
+            resp = self._load(key, *row[:4])
+            if resp is not None:
+                return resp
+        if self.offline:
+            raise CacheMiss(f"Not cached (offline mode): {key_url}")
+
+        self._pace()
+        resp = self.session.get(url, params=params, **kwargs)
+        resp.from_cache = False
+        if resp.status_code < 400:
+            if kwargs.get("stream"):
+                self._store_when_consumed(key, key_url, resp)
+            else:
+                self._store(key, key_url, resp)
+        return resp
+
+    def is_cached(self, url, params=None):
+        """True if get() would be answered from the cache without a network request."""
+        if self.disabled:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT stored_at FROM entries WHERE key = ?", (self._key(normalize_request_url(url, params)),)
+            ).fetchone()
+        return bool(row) and (self.offline or time.time() - row[0] < self.ttl)
+
+    def invalidate(self, url, params=None):
+        """Drop the cached response for a request, e.g. one that turned out to be an error page."""
+        key = self._key(normalize_request_url(url, params))
+        with self._lock, self._db:
+            row = self._db.execute("SELECT blob FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if row:
+                self._drop_blob_if_unused(row[0])
+
+    # -- internals --------------------------------------------------------
+
+    @staticmethod
+    def _key(key_url):
+        return hashlib.sha256(f"GET {key_url}".encode("utf-8")).hexdigest()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], f"{digest}.z")
+
+    def _pace(self):
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request)
+            self._next_request = start + self.min_interval
+        time.sleep(max(0.0, start - now))
+
+    def _load(self, key, final_url, status, headers, digest):
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        with self._lock, self._db:
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp.reason = "OK"
+        resp.url = final_url
+        resp.headers = CaseInsensitiveDict(json.loads(headers))
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = body
+        resp._content_consumed = True
+        resp.from_cache = True
+        return resp
+
+    def _store_when_consumed(self, key, key_url, resp):
+        """Leave a streamed response unread, and cache its body only if the caller reads all of it.
+
+        A caller that stops early (e.g. after </body>) downloads no more than
+        it needs; the partial body is not stored, so the cache never serves a
+        truncated response.
+        """
+        read_chunks = resp.iter_content
+
+        def iter_content(chunk_size=1, decode_unicode=False):
+            def tee():
+                chunks = []
+                for chunk in read_chunks(chunk_size):
+                    chunks.append(chunk)
+                    yield chunk
+                self._store(key, key_url, resp, b"".join(chunks))
+            chunks = tee()
+            return stream_decode_response_unicode(chunks, resp) if decode_unicode else chunks
+
+        # content, text, json() and iter_lines() all read through iter_content
+        resp.iter_content = iter_content
+
+    def _store(self, key, key_url, resp, body=None):
+        body = resp.content if body is None else body
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(body, 6))
+            os.replace(tmp, path)
+        # The stored body is already decoded, so transfer headers no longer apply
+        headers = {k: v for k, v in resp.headers.items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+        now = time.time()
+        with self._lock, self._db:
+            old = self._db.execute("SELECT blob FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, key_url, resp.url or key_url, self.source, resp.status_code, json.dumps(headers), digest,
+                 os.path.getsize(path), now, now),
+            )
+            if old and old[0] != digest:
+                self._drop_blob_if_unused(old[0])
+            self._evict()
+
+    def _drop_blob_if_unused(self, digest):
+        if not self._db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone():
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        # Caller holds the lock and an open transaction
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT blob, size FROM entries)").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, digest, size in self._db.execute(
+                "SELECT key, blob, size FROM entries ORDER BY accessed_at").fetchall():
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if not self._db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone():
+                self._drop_blob_if_unused(digest)
+                total -= size
+                if total <= self.max_bytes:
+                    break
@@ -0,0 +1,34 @@
+"""
+Pooled, retrying requests sessions for the multi-threaded scrapers in this repo.
+
+Usage (scripts live one or two folders below this file):
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+  from http_session import pooled_session
+
+  session = pooled_session(workers=8, retries=5, backoff=2.0, headers={"User-Agent": USER_AGENT})
+
+Wrap it in http_cache.CachedSession(..., session=session) to cache responses too.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def pooled_session(workers, retries=5, backoff=1.0, hosts=1, headers=None):
+    """One keep-alive pool for all workers; connection errors, throttling (429) and 5xx are retried with backoff.
+
+    The pool keeps up to `workers` connections for each of `hosts` hosts.
+    Retries happen before any body is read, and honour Retry-After.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=("GET",), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=max(1, hosts), pool_maxsize=max(1, workers), max_retries=retry)
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session